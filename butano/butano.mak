@@ -111,7 +111,7 @@ SFILES          :=	$(foreach dir,	$(SOURCES),	$(notdir $(wildcard $(dir)/*.s)))
 BINFILES        :=	$(foreach dir,	$(DATA),	$(notdir $(wildcard $(dir)/*.*))) \
 						_bn_audio_soundbank.bin
 						
-GRAPHICSFILES	:=	$(foreach dir,	$(GRAPHICS),	$(notdir $(wildcard $(dir)/*.bmp)))
+GRAPHICSFILES	:=	$(foreach dir,	$(GRAPHICS),	$(notdir $(wildcard $(dir)/*.bmp $(dir)/*.png)))
 
 #---------------------------------------------------------------------------------------------------------------------
 # Use CXX for linking C++ projects, CC for standard C:
@@ -129,7 +129,7 @@ endif
 
 export OFILES_BIN       :=  $(addsuffix .o,$(BINFILES))
 
-export OFILES_GRAPHICS	:=  $(GRAPHICSFILES:.bmp=_bn_gfx.o)
+export OFILES_GRAPHICS	:=  $(addsuffix _bn_gfx.o,$(basename $(GRAPHICSFILES)))
 
 export OFILES_SOURCES   :=  $(CPPFILES:.cpp=.o) $(CFILES:.c=.o) $(SFILES:.s=.o)
  
@@ -1138,11 +1138,21 @@
  *   * `"bpp_4_auto"`: up to 16 colors per @ref tile "tile".
  * Butano tries to quantize the image to fit the color palette into the required one.
  * It is not supported if an external bn::bg_palette_item is referenced with `"palette_item"`.
+ * The quantization algorithm is specified with the `"bpp_4_auto_strategy"` field.
  *   * `"bpp_4_manual"`: up to 16 colors per @ref tile "tile".
  * Butano expects that the image color palette is already valid for this mode.
  *   * `"bpp_4"`: `"bpp_4_manual"` alias.
  *
  * The default is `"bpp_4_manual"` for 16 color images and `"bpp_8"` for 256 color images.
+ * * `"bpp_4_auto_strategy"`: optional field which specifies how colors are grouped into 16 color palettes
+ * when `"bpp_mode"` is `"bpp_4_auto"`:
+ *   * `"greedy"`: repeatedly merges the two groups of colors with the smallest union (this is the default option).
+ *   * `"optimal"`: searches for the packing with the fewest palettes,
+ * falling back to the `"greedy"` one if it doesn't find a better packing.
+ * * `"bpp_4_auto_optimal_max_nodes"`: optional field which specifies the maximum number of steps
+ * of the `"optimal"` strategy search (100000 by default).
+ * The search is stopped after this number of steps instead of after some time,
+ * so the result doesn't depend on the speed of the build machine.
  * * `"repeated_tiles_reduction"`: optional field which specifies if repeated tiles must be reduced or not
  * (`true` by default).
  * * `"flipped_tiles_reduction"`: optional field which specifies if flipped tiles must be reduced or not
@@ -1316,6 +1326,27 @@
  *
  * The recommended quality for sound effects is 8-bits 22050 Hz.
  *
+ * Optionally, a sound effect can be converted before importing it with a \*.json file with the same name,
+ * so `sfx.wav` can be converted with `sfx.json`:
+ *
+ * @code{.json}
+ * {
+ *     "mono": true,
+ *     "sample_rate": 22050,
+ *     "bits_per_sample": 8,
+ *     "trim_silence": true
+ * }
+ * @endcode
+ *
+ * All fields are optional:
+ * * `"mono"`: specifies if stereo files must be downmixed to mono or not (`false` by default).
+ * * `"sample_rate"`: sample rate in Hz of the converted file (by default the sample rate is not changed).
+ * * `"bits_per_sample"`: bits per sample of the converted file (8 or 16).
+ * By default, 8-bits files are kept as they are and the other ones are converted to 16-bits.
+ * * `"trim_silence"`: specifies if leading and trailing silence must be removed or not (`false` by default).
+ *
+ * Loop points and other metadata of converted files are not preserved.
+ *
  * If the conversion process has finished successfully,
  * a bunch of bn::sound_item objects under the `bn::sound_items` namespace
  * should have been generated in the `build` folder for all sound files.
@@ -1741,23 +1772,6 @@
  * Because of these limitations, you should avoid affine backgrounds whenever possible.
  *
  *
- * @subsection faq_background_error_grit Why can't I import a regular background with 1024 or less tiles?
- *
- * If you get this error when trying to import a regular background with 1024 or less tiles:
- *
- * `error: Regular BGs with more than 1024 tiles not supported: 1025`
- *
- * Or you get this error when importing an affine background with 256 or less tiles:
- *
- * `error: Affine BGs with more than 256 tiles not supported: 257`
- *
- * Your image is fine, but <a href=" https://www.coranac.com/projects/grit/">grit</a>
- * (the tool used by Butano to import images) is generating unneeded extra tiles.
- *
- * The only workaround that I know of is reducing detail in your input image until the tiles count of
- * the generated background is valid.
- *
- *
  * @section faq_audio Audio
  *
  *
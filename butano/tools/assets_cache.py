@@ -0,0 +1,66 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import os
+import shutil
+
+from output_file import copy_output_file, create_temp_folder
+
+
+class AssetsCache:
+
+    @staticmethod
+    def create(cache_folder_path):
+        if cache_folder_path is None:
+            cache_folder_path = os.environ.get('BN_ASSETS_CACHE')
+
+        if not cache_folder_path:
+            return None
+
+        os.makedirs(cache_folder_path, exist_ok=True)
+        return AssetsCache(cache_folder_path)
+
+    def __init__(self, cache_folder_path):
+        self.__cache_folder_path = cache_folder_path
+
+    def load(self, key, output_folder_path):
+        entry_folder_path = os.path.join(self.__cache_folder_path, key)
+        info_file_path = os.path.join(entry_folder_path, '_bn_cache_info.txt')
+
+        try:
+            with open(info_file_path, 'r') as info_file:
+                info = info_file.read().splitlines()
+
+            for file_name in info[1:]:
+                copy_output_file(os.path.join(entry_folder_path, file_name),
+                                 os.path.join(output_folder_path, file_name))
+        except OSError:
+            return None
+
+        return info[0]
+
+    def store(self, key, file_paths, info):
+        entry_folder_path = os.path.join(self.__cache_folder_path, key)
+
+        if os.path.isdir(entry_folder_path):
+            return
+
+        temp_folder_path = create_temp_folder(self.__cache_folder_path)
+
+        try:
+            file_names = []
+
+            for file_path in file_paths:
+                file_name = os.path.basename(file_path)
+                shutil.copyfile(file_path, os.path.join(temp_folder_path, file_name))
+                file_names.append(file_name)
+
+            with open(os.path.join(temp_folder_path, '_bn_cache_info.txt'), 'w') as info_file:
+                info_file.write('\n'.join([info] + file_names))
+
+            os.rename(temp_folder_path, entry_folder_path)
+        except OSError:
+            # Cache entries are optional (another build could have stored the same entry first):
+            shutil.rmtree(temp_folder_path, ignore_errors=True)
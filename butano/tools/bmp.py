@@ -3,14 +3,14 @@ Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
 zlib License, see LICENSE file.
 """
 
-import shutil
 import struct
 from img_processor import ImageProcessor
 
 class BMP(ImageProcessor):
 
-    def __init__(self, file_path):
-        super().__init__(file_path)
+    def __init__(self, file_path, decoded_images_cache=None):
+        super().__init__(file_path, decoded_images_cache)
+        self.__file_path = file_path
 
         with open(file_path, 'rb') as file:
             def read_int():
@@ -42,6 +42,7 @@ class BMP(ImageProcessor):
 
             file.read(2)
             bits_per_pixel = read_short()
+            self.__bits_per_pixel = bits_per_pixel
 
             if bits_per_pixel != 4 and bits_per_pixel != 8:
                 raise ValueError('Invalid bits per pixel: ' + str(bits_per_pixel))
@@ -54,24 +55,49 @@ class BMP(ImageProcessor):
             file.read(20)
             self.__colors_offset = file.tell()
 
-            if bits_per_pixel == 4:
-                colors_count = 16
-            else:
-                colors_count = 256
-                self.__colors = struct.unpack(str(colors_count) + 'I', file.read(colors_count * 4))
 
-                file.seek(self.__pixels_offset)
-                pixels_count = self.width * self.height  # no padding, multiple of 8.
-                self.__pixels = [ord(pixel) for pixel in
-                                 struct.unpack(str(pixels_count) + 'c', file.read(pixels_count))]
+    def calculate_colors_count(self):
+        if self.__bits_per_pixel == 4:
+            return 16
 
-                colors_count = max(self.__pixels) + 1
-                extra_colors = colors_count % 16
+        pixels, colors = self.decode()
+        colors_count = max(pixels) + 1
+        extra_colors = colors_count % 16
 
-                if extra_colors > 0:
-                    colors_count += 16 - extra_colors
+        if extra_colors > 0:
+            colors_count += 16 - extra_colors
 
-                if colors_count > 256:
-                    raise ValueError('Invalid calculated colors count: ' + str(colors_count))
+        if colors_count > 256:
+            raise ValueError('Invalid calculated colors count: ' + str(colors_count))
 
-            self.colors_count = colors_count
+        return colors_count
+
+    def decode_pixels(self):
+        with open(self.__file_path, 'rb') as file:
+            data = memoryview(file.read())
+
+        colors_count = 1 << self.__bits_per_pixel
+        colors_data = data[self.__colors_offset:self.__colors_offset + (colors_count * 4)]
+        colors = [(red, green, blue) for blue, green, red, _ in struct.iter_unpack('4B', colors_data)]
+
+        row_size = (self.width * self.__bits_per_pixel) // 8  # no padding, multiple of 8.
+        pixels_size = row_size * self.height
+        bottom_up_pixels = data[self.__pixels_offset:self.__pixels_offset + pixels_size]
+        pixels = bytearray(pixels_size)
+        last_row = pixels_size - row_size
+
+        for row in range(0, pixels_size, row_size):
+            bottom_up_row = last_row - row
+            pixels[row:row + row_size] = bottom_up_pixels[bottom_up_row:bottom_up_row + row_size]
+
+        if self.__bits_per_pixel == 4:
+            packed_pixels = bytes(pixels)
+            pixels = bytearray(pixels_size * 2)
+            pixels[0::2] = packed_pixels.translate(_HIGH_NIBBLES)
+            pixels[1::2] = packed_pixels.translate(_LOW_NIBBLES)
+
+        return bytes(pixels), colors
+
+
+_HIGH_NIBBLES = bytes(value >> 4 for value in range(256))
+_LOW_NIBBLES = bytes(value & 15 for value in range(256))
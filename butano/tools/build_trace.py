@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import functools
+import json
+import os
+import time
+
+
+# Trace events of this process (None if tracing is disabled):
+_events = None
+
+
+def enable():
+    global _events
+    _events = []
+
+
+def enabled():
+    return _events is not None
+
+
+def now():
+    return time.perf_counter()
+
+
+def add_span(name, start_time, end_time, args=None):
+    if _events is not None:
+        pid = os.getpid()
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': start_time * 1000000,
+            'dur': (end_time - start_time) * 1000000,
+            'pid': pid,
+            'tid': pid,
+        }
+
+        if args:
+            event['args'] = args
+
+        _events.append(event)
+
+
+def add_events(events):
+    if _events is not None:
+        _events.extend(events)
+
+
+def take_events():
+    global _events
+    events = _events
+    _events = []
+    return events
+
+
+class Span:
+
+    def __init__(self, name, args=None):
+        self.__name = name
+        self.__args = args
+        self.__start_time = None
+
+    def __enter__(self):
+        if _events is not None:
+            self.__start_time = now()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.__start_time is not None:
+            add_span(self.__name, self.__start_time, now(), self.__args)
+
+        return False
+
+
+def traced(function):
+    @functools.wraps(function)
+    def traced_function(*args, **kwargs):
+        if _events is None:
+            return function(*args, **kwargs)
+
+        with Span(function.__name__):
+            return function(*args, **kwargs)
+
+    return traced_function
+
+
+def write(file_path):
+    main_pid = os.getpid()
+    events = []
+
+    for pid in sorted(set(event['pid'] for event in _events)):
+        process_name = 'butano_assets_tool' if pid == main_pid else 'worker ' + str(pid)
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': pid, 'args': {'name': process_name}})
+
+    events.extend(_events)
+
+    with open(file_path, 'w') as trace_file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
@@ -1,21 +1,75 @@
 import argparse
+import os
 import sys
 import traceback
 
-from butano_audio_tool import process_audio
-from butano_graphics_tool import process_graphics
-
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Butano assets tool.')
     parser.add_argument('--audio', required=True, help='audio folder paths')
     parser.add_argument('--graphics', required=True, help='graphics folder paths')
     parser.add_argument('--build', required=True, help='build folder path')
+    parser.add_argument('--cache', help='shared assets cache folder path (BN_ASSETS_CACHE by default)')
+    parser.add_argument('--trace', help='Chrome trace event format build trace file path (BN_ASSETS_TRACE by default)')
 
     try:
         args = parser.parse_args()
-        process_audio(args.audio, args.build)
-        process_graphics(args.graphics, args.build)
+
+        # This tool is run with -B to keep the source tree clean, so bytecode is cached in the build folder instead,
+        # before importing the tool modules.
+        # The environment variable makes spawned worker processes read the same cached bytecode:
+        if hasattr(sys, 'pycache_prefix'):
+            sys.pycache_prefix = os.path.join(os.path.abspath(args.build), '_bn_pycache')
+            sys.dont_write_bytecode = False
+            os.environ['PYTHONPYCACHEPREFIX'] = sys.pycache_prefix
+
+        import build_trace
+        from file_info import FileInfo
+
+        if args.trace is None:
+            args.trace = os.environ.get('BN_ASSETS_TRACE') or None
+
+        if args.trace is not None:
+            build_trace.enable()
+
+        try:
+            # If no asset file nor tool file has changed since the last successful run, there's nothing to do:
+            tools_folder_path = os.path.dirname(os.path.abspath(__file__))
+            assets_file_info_path = os.path.join(args.build, '_bn_assets_file_info.txt')
+
+            with build_trace.Span('check_assets_file_info'):
+                old_assets_file_info = FileInfo.read(assets_file_info_path)
+                new_assets_file_info = FileInfo.build_from_folders(
+                    [tools_folder_path] + args.audio.split(' ') + args.graphics.split(' '))
+
+            if old_assets_file_info == new_assets_file_info:
+                exit(0)
+
+            if os.path.exists(assets_file_info_path):
+                os.remove(assets_file_info_path)
+
+            from assets_cache import AssetsCache
+            from butano_audio_tool import AudioProcessor
+            from butano_graphics_tool import process_graphics
+
+            # mmutil runs in its own process, so the soundbank is built while graphics are being processed:
+            assets_cache = AssetsCache.create(args.cache)
+            audio_processor = AudioProcessor(args.audio, args.build, assets_cache)
+
+            with build_trace.Span('start_audio'):
+                audio_processor.start()
+
+            try:
+                with build_trace.Span('process_graphics'):
+                    process_graphics(args.graphics, args.build, assets_cache)
+            finally:
+                with build_trace.Span('finish_audio'):
+                    audio_processor.finish()
+
+            new_assets_file_info.write(assets_file_info_path)
+        finally:
+            if args.trace is not None:
+                build_trace.write(args.trace)
     except Exception as ex:
         sys.stderr.write('Error: ' + str(ex) + '\n')
         traceback.print_exc()
@@ -3,11 +3,15 @@ Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
 zlib License, see LICENSE file.
 """
 
+import json
 import os
 import subprocess
 import sys
 
+import build_trace
 from file_info import FileInfo
+from output_file import OutputFile
+from wav_processor import WavProcessor
 
 
 def list_audio_files(audio_folder_paths):
@@ -15,6 +19,7 @@ def list_audio_files(audio_folder_paths):
     audio_file_names = []
     audio_file_names_no_ext = []
     audio_file_paths = []
+    audio_json_file_paths = []
 
     for audio_folder_path in audio_folder_path_list:
         folder_audio_file_names = sorted(os.listdir(audio_folder_path))
@@ -25,14 +30,54 @@ def list_audio_files(audio_folder_paths):
             if os.path.isfile(audio_file_path) and FileInfo.validate(audio_file_name):
                 audio_file_name_split = os.path.splitext(audio_file_name)
                 audio_file_name_no_ext = audio_file_name_split[0]
+
+                # Json files are not audio files, but optional settings of the audio file with the same name:
+                if audio_file_name_split[1] == '.json':
+                    continue
+
+                json_file_path = audio_folder_path + '/' + audio_file_name_no_ext + '.json'
+
+                if not os.path.isfile(json_file_path):
+                    json_file_path = None
+
                 audio_file_names.append(audio_file_name)
                 audio_file_names_no_ext.append(audio_file_name_no_ext)
                 audio_file_paths.append(audio_file_path)
+                audio_json_file_paths.append(json_file_path)
 
-    return audio_file_names, audio_file_names_no_ext, audio_file_paths
+    return audio_file_names, audio_file_names_no_ext, audio_file_paths, audio_json_file_paths
 
 
-def process_audio_files(audio_file_paths, soundbank_bin_path, soundbank_header_path, build_folder_path):
+def preprocess_audio_file(audio_file_name, audio_file_path, json_file_path, build_folder_path):
+    if os.path.splitext(audio_file_name)[1] != '.wav':
+        raise ValueError('Audio json files are only supported for *.wav files: ' + json_file_path)
+
+    preprocessed_folder_path = build_folder_path + '/_bn_audio_files'
+    preprocessed_file_path = preprocessed_folder_path + '/' + audio_file_name
+    file_info_path = preprocessed_folder_path + '/_bn_' + audio_file_name + '_file_info.txt'
+    old_file_info = FileInfo.read(file_info_path)
+    new_file_info = FileInfo.build_from_contents([audio_file_path, json_file_path], [])
+
+    if old_file_info == new_file_info and os.path.isfile(preprocessed_file_path):
+        return preprocessed_file_path
+
+    try:
+        with open(json_file_path) as json_file:
+            info = json.load(json_file)
+
+        wav_processor = WavProcessor(audio_file_path, info)
+        os.makedirs(preprocessed_folder_path, exist_ok=True)
+
+        with OutputFile(preprocessed_file_path, True) as preprocessed_file:
+            wav_processor.process(preprocessed_file)
+    except Exception as exc:
+        raise ValueError(audio_file_name + ' error: ' + str(exc))
+
+    new_file_info.write(file_info_path)
+    return preprocessed_file_path
+
+
+def start_audio_files_process(audio_file_paths, soundbank_bin_path, soundbank_header_path, build_folder_path):
     command = ['mmutil']
 
     if not audio_file_paths:
@@ -49,17 +94,31 @@ def process_audio_files(audio_file_paths, soundbank_bin_path, soundbank_header_p
     command.append('-h' + soundbank_header_path)
     command = ' '.join(command)
 
-    try:
-        subprocess.check_output(command, shell=True, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as e:
-        raise ValueError('mmutil call failed (return code ' + str(e.returncode) + '): ' + str(e.output))
+    # mmutil output goes to a file instead of a pipe, so mmutil doesn't block when the pipe buffer is full
+    # while graphics are being processed:
+    with open(build_folder_path + '/_bn_audio_output.txt', 'wb') as output_file:
+        return subprocess.Popen(command, shell=True, stdout=output_file, stderr=subprocess.STDOUT)
+
+
+def wait_audio_files_process(audio_files_process, soundbank_bin_path, build_folder_path):
+    audio_files_process.wait()
+    output_file_path = build_folder_path + '/_bn_audio_output.txt'
+
+    with open(output_file_path, 'rb') as output_file:
+        output = output_file.read()
+
+    os.remove(output_file_path)
+
+    if audio_files_process.returncode != 0:
+        raise ValueError('mmutil call failed (return code ' + str(audio_files_process.returncode) + '): ' +
+                         str(output))
 
     return os.path.getsize(soundbank_bin_path)
 
 
 def write_output_file(items, include_guard, include_file, namespace, item_class, output_file_path):
     if len(items) > 0:
-        with open(output_file_path, 'w') as output_file:
+        with OutputFile(output_file_path) as output_file:
             output_file.write('#ifndef ' + include_guard + '\n')
             output_file.write('#define ' + include_guard + '\n')
             output_file.write('\n')
@@ -83,7 +142,7 @@ def write_output_file(items, include_guard, include_file, namespace, item_class,
 
 
 def write_output_info_file(items, include_guard, include_file, namespace, item_class, output_file_path):
-    with open(output_file_path, 'w') as output_file:
+    with OutputFile(output_file_path) as output_file:
         output_file.write('#ifndef ' + include_guard + '\n')
         output_file.write('#define ' + include_guard + '\n')
         output_file.write('\n')
@@ -117,6 +176,7 @@ def write_output_info_file(items, include_guard, include_file, namespace, item_c
     print('    ' + item_class + 's_info file written in ' + output_file_path)
 
 
+@build_trace.traced
 def write_output_files(audio_file_names_no_ext, soundbank_header_path, build_folder_path):
     music_items_list = []
     sound_items_list = []
@@ -161,24 +221,103 @@ def write_output_files(audio_file_names_no_ext, soundbank_header_path, build_fol
                            'sound_item', build_folder_path + '/bn_sound_items_info.h')
 
 
-def process_audio(audio_folder_paths, build_folder_path):
-    audio_file_names, audio_file_names_no_ext, audio_file_paths = list_audio_files(audio_folder_paths)
-    file_info_path = build_folder_path + '/_bn_audio_files_info.txt'
-    old_file_info = FileInfo.read(file_info_path)
-    new_file_info = FileInfo.build_from_files(audio_file_paths)
+class AudioProcessor:
+
+    def __init__(self, audio_folder_paths, build_folder_path, assets_cache=None):
+        self.__audio_folder_paths = audio_folder_paths
+        self.__build_folder_path = build_folder_path
+        self.__assets_cache = assets_cache
+        self.__soundbank_bin_path = build_folder_path + '/_bn_audio_soundbank.bin'
+        self.__soundbank_header_path = build_folder_path + '/_bn_audio_soundbank.h'
+        self.__file_info_path = build_folder_path + '/_bn_audio_files_info.txt'
+        self.__soundbank_info_path = build_folder_path + '/_bn_audio_soundbank_info.txt'
+        self.__audio_file_names = None
+        self.__audio_file_names_no_ext = None
+        self.__new_file_info = None
+        self.__new_soundbank_info = None
+        self.__audio_files_process = None
+        self.__audio_files_process_start_time = None
+        self.__soundbank_cached = False
+
+    def start(self):
+        audio_file_names, audio_file_names_no_ext, audio_file_paths, audio_json_file_paths = \
+            list_audio_files(self.__audio_folder_paths)
+        old_file_info = FileInfo.read(self.__file_info_path)
+        new_file_info = FileInfo.build_from_files(
+            audio_file_paths + [json_file_path for json_file_path in audio_json_file_paths if json_file_path])
+
+        if old_file_info == new_file_info:
+            return
+
+        # Audio files with a json file are preprocessed, and the preprocessed ones are passed to mmutil instead:
+        for index, json_file_path in enumerate(audio_json_file_paths):
+            if json_file_path is not None:
+                with build_trace.Span('preprocess_audio_file', {'file': audio_file_names[index]}):
+                    audio_file_paths[index] = preprocess_audio_file(
+                        audio_file_names[index], audio_file_paths[index], json_file_path, self.__build_folder_path)
+
+        # If only the audio files modification times have changed, the soundbank doesn't need to be rebuilt:
+        old_soundbank_info = FileInfo.read(self.__soundbank_info_path)
+        new_soundbank_info = FileInfo.build_from_contents(audio_file_paths, audio_file_names)
+
+        if old_soundbank_info == new_soundbank_info and os.path.isfile(self.__soundbank_bin_path):
+            new_file_info.write(self.__file_info_path)
+            return
+
+        if os.path.exists(self.__soundbank_info_path):
+            os.remove(self.__soundbank_info_path)
+
+        self.__audio_file_names = audio_file_names
+        self.__audio_file_names_no_ext = audio_file_names_no_ext
+        self.__new_file_info = new_file_info
+        self.__new_soundbank_info = new_soundbank_info
+        assets_cache = self.__assets_cache
+
+        if assets_cache is not None:
+            if assets_cache.load(self.__cache_key(), self.__build_folder_path) is not None:
+                self.__soundbank_cached = True
+                return
+
+        self.__audio_files_process_start_time = build_trace.now()
+        self.__audio_files_process = start_audio_files_process(
+            audio_file_paths, self.__soundbank_bin_path, self.__soundbank_header_path, self.__build_folder_path)
+
+    def finish(self):
+        audio_files_process = self.__audio_files_process
+
+        if audio_files_process is None and not self.__soundbank_cached:
+            return
+
+        self.__audio_files_process = None
+
+        for audio_file_name in self.__audio_file_names:
+            print(audio_file_name)
+
+        sys.stdout.flush()
+
+        if audio_files_process is None:
+            total_size = os.path.getsize(self.__soundbank_bin_path)
+        else:
+            total_size = wait_audio_files_process(audio_files_process, self.__soundbank_bin_path,
+                                                  self.__build_folder_path)
+            build_trace.add_span('mmutil', self.__audio_files_process_start_time, build_trace.now(),
+                                 {'files': len(self.__audio_file_names)})
 
-    if old_file_info == new_file_info:
-        return
+            if self.__assets_cache is not None:
+                self.__assets_cache.store(self.__cache_key(), [self.__soundbank_bin_path, self.__soundbank_header_path],
+                                          str(total_size))
 
-    for audio_file_name in audio_file_names:
-        print(audio_file_name)
+        write_output_files(self.__audio_file_names_no_ext, self.__soundbank_header_path, self.__build_folder_path)
+        print('    Processed audio size: ' + str(total_size) + ' bytes')
+        os.remove(self.__soundbank_header_path)
+        self.__new_soundbank_info.write(self.__soundbank_info_path)
+        self.__new_file_info.write(self.__file_info_path)
 
-    sys.stdout.flush()
+    def __cache_key(self):
+        return '_bn_audio_soundbank_' + self.__new_soundbank_info.info()
 
-    soundbank_bin_path = build_folder_path + '/_bn_audio_soundbank.bin'
-    soundbank_header_path = build_folder_path + '/_bn_audio_soundbank.h'
-    total_size = process_audio_files(audio_file_paths, soundbank_bin_path, soundbank_header_path, build_folder_path)
-    write_output_files(audio_file_names_no_ext, soundbank_header_path, build_folder_path)
-    print('    Processed audio size: ' + str(total_size) + ' bytes')
-    os.remove(soundbank_header_path)
-    new_file_info.write(file_info_path)
+
+def process_audio(audio_folder_paths, build_folder_path, assets_cache=None):
+    audio_processor = AudioProcessor(audio_folder_paths, build_folder_path, assets_cache)
+    audio_processor.start()
+    audio_processor.finish()
@@ -9,6 +9,7 @@ import string
 import sys
 from multiprocessing import Pool
 
+import build_trace
 from file_info import FileInfo
 from fixed_bg import FixedBgItem
 from affine_bg import AffineBgItem
@@ -17,22 +18,56 @@ from regular_bg import RegularBgItem
 from sprite_palette import SpritePaletteItem
 from sprite_tiles import SpriteTilesItem
 from sprite import SpriteItem
+from util import get_decoded_images_cache, get_image_size
 
 
 class GraphicsFileInfo:
 
-    def __init__(self, json_file_path, file_path, file_name, file_name_no_ext, file_info_path):
+    def __init__(self, json_file_path, file_path, file_name, file_name_no_ext, file_info_path, file_info):
         self.__json_file_path = json_file_path
         self.__file_path = file_path
         self.__file_name = file_name
         self.__file_name_no_ext = file_name_no_ext
         self.__file_info_path = file_info_path
+        self.__file_info = file_info
 
     def print_file_name(self):
         print(self.__file_name)
 
-    def process(self, build_folder_path):
+    def cost(self):
         try:
+            width, height = get_image_size(self.__file_path)
+
+            with open(self.__json_file_path) as json_file:
+                info = json.load(json_file)
+
+            # Each auto compression field requires to compress its data with every compression type:
+            passes = 1
+            compression = info.get('compression', 'none')
+
+            for compression_field in ['tiles_compression', 'palette_compression', 'map_compression']:
+                if info.get(compression_field, compression) == 'auto':
+                    passes += 2
+
+            return width * height * passes
+        except Exception:
+            return 0  # Errors are reported when processed.
+
+    def process(self, build_folder_path, assets_cache):
+        with build_trace.Span(self.__file_name):
+            return self.__process(build_folder_path, assets_cache)
+
+    def __process(self, build_folder_path, assets_cache):
+        try:
+            if assets_cache is not None:
+                cache_key = self.__file_name_no_ext + '_' + self.__file_info.info()
+                cache_info = assets_cache.load(cache_key, build_folder_path)
+
+                if cache_info is not None:
+                    total_size, header_file_name = cache_info.split()
+                    self.__file_info.write(self.__file_info_path)
+                    return [self.__file_name, build_folder_path + '/' + header_file_name, int(total_size)]
+
             try:
                 with open(self.__json_file_path) as json_file:
                     info = json.load(json_file)
@@ -64,8 +99,12 @@ class GraphicsFileInfo:
 
             total_size, header_file_path = item.process()
 
-            with open(self.__file_info_path, 'w') as file_info:
-                file_info.write('')
+            if assets_cache is not None:
+                gfx_file_path = build_folder_path + '/' + self.__file_name_no_ext + '_bn_gfx.s'
+                assets_cache.store(cache_key, [header_file_path, gfx_file_path],
+                                   str(total_size) + ' ' + os.path.basename(header_file_path))
+
+            self.__file_info.write(self.__file_info_path)
 
             return [self.__file_name, header_file_path, total_size]
         except Exception as exc:
@@ -74,11 +113,31 @@ class GraphicsFileInfo:
 
 class GraphicsFileInfoProcessor:
 
-    def __init__(self, build_folder_path):
+    def __init__(self, build_folder_path, assets_cache, trace):
         self.__build_folder_path = build_folder_path
+        self.__assets_cache = assets_cache
+        self.__trace = trace
 
     def __call__(self, graphics_file_info):
-        return graphics_file_info.process(self.__build_folder_path)
+        if not self.__trace:
+            return graphics_file_info.process(self.__build_folder_path, self.__assets_cache), None
+
+        # Trace events are recorded in the worker process and returned with the process result:
+        build_trace.enable()
+        process_result = graphics_file_info.process(self.__build_folder_path, self.__assets_cache)
+        return process_result, build_trace.take_events()
+
+
+def build_graphics_file_info(graphics_file_path, graphics_file_name_no_ext, json_file_path):
+    with open(json_file_path, 'r') as json_file:
+        json_data = json_file.read()
+
+    try:
+        json_data = json.dumps(json.loads(json_data), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        pass  # Invalid json files are reported when processed.
+
+    return FileInfo.build_from_contents([graphics_file_path], [graphics_file_name_no_ext, json_data])
 
 
 def list_graphics_file_infos(graphics_folder_paths, build_folder_path):
@@ -87,12 +146,13 @@ def list_graphics_file_infos(graphics_folder_paths, build_folder_path):
     file_names_set = set()
 
     for graphics_folder_path in graphics_folder_path_list:
-        graphics_file_names = os.listdir(graphics_folder_path)
+        with os.scandir(graphics_folder_path) as graphics_folder_entries:
+            graphics_file_names = [entry.name for entry in graphics_folder_entries if entry.is_file()]
 
         for graphics_file_name in graphics_file_names:
             graphics_file_path = graphics_folder_path + '/' + graphics_file_name
 
-            if os.path.isfile(graphics_file_path) and FileInfo.validate(graphics_file_name):
+            if FileInfo.validate(graphics_file_name):
                 graphics_file_name_split = os.path.splitext(graphics_file_name)
                 graphics_file_name_no_ext = graphics_file_name_split[0]
                 graphics_file_name_ext = graphics_file_name_split[1]
@@ -109,29 +169,21 @@ def list_graphics_file_infos(graphics_folder_paths, build_folder_path):
                         raise ValueError('Graphics json file not found: ' + json_file_path)
 
                     file_info_path = build_folder_path + '/_bn_' + graphics_file_name_no_ext + '_file_info.txt'
+                    old_file_info = FileInfo.read(file_info_path)
+                    new_file_info = build_graphics_file_info(graphics_file_path, graphics_file_name_no_ext,
+                                                             json_file_path)
 
-                    if not os.path.exists(file_info_path):
-                        build = True
-                    else:
-                        file_info_mtime = os.path.getmtime(file_info_path)
-                        graphics_file_mtime = os.path.getmtime(graphics_file_path)
-
-                        if file_info_mtime < graphics_file_mtime:
-                            build = True
-                        else:
-                            json_file_mtime = os.path.getmtime(json_file_path)
-                            build = file_info_mtime < json_file_mtime
-
-                    if build:
+                    if old_file_info != new_file_info:
                         graphics_file_infos.append(GraphicsFileInfo(
                             json_file_path, graphics_file_path, graphics_file_name, graphics_file_name_no_ext,
-                            file_info_path))
+                            file_info_path, new_file_info))
 
     return graphics_file_infos
 
 
-def process_graphics(graphics_folder_paths, build_folder_path):
-    graphics_file_infos = list_graphics_file_infos(graphics_folder_paths, build_folder_path)
+def process_graphics(graphics_folder_paths, build_folder_path, assets_cache=None):
+    with build_trace.Span('list_graphics_file_infos'):
+        graphics_file_infos = list_graphics_file_infos(graphics_folder_paths, build_folder_path)
 
     if len(graphics_file_infos) > 0:
         for graphics_file_info in graphics_file_infos:
@@ -139,28 +191,34 @@ def process_graphics(graphics_folder_paths, build_folder_path):
 
         sys.stdout.flush()
 
-        pool = Pool()
-        process_results = pool.map(GraphicsFileInfoProcessor(build_folder_path), graphics_file_infos)
-        pool.close()
-
+        # Process the most expensive items first, so a big one doesn't keep the other workers idle at the end:
+        graphics_file_infos.sort(key=lambda graphics_file_info: graphics_file_info.cost(), reverse=True)
         total_size = 0
-        process_excs = []
-
-        for process_result in process_results:
-            if len(process_result) == 3:
-                file_size = process_result[2]
-                total_size += file_size
-                print('    ' + str(process_result[0]) + ' item header written in ' + str(process_result[1]) +
-                      ' (graphics size: ' + str(file_size) + ' bytes)')
-            else:
-                process_excs.append(process_result)
-
-        sys.stdout.flush()
-
-        if len(process_excs) > 0:
-            for process_exc in process_excs:
-                sys.stderr.write(str(process_exc[0]) + ' error: ' + str(process_exc[1]) + '\n')
-
+        process_excs_count = 0
+
+        with Pool() as pool:
+            graphics_file_info_processor = GraphicsFileInfoProcessor(build_folder_path, assets_cache,
+                                                                     build_trace.enabled())
+
+            for process_result, trace_events in pool.imap_unordered(graphics_file_info_processor,
+                                                                    graphics_file_infos):
+                if trace_events is not None:
+                    build_trace.add_events(trace_events)
+
+                if len(process_result) == 3:
+                    file_size = process_result[2]
+                    total_size += file_size
+                    print('    ' + str(process_result[0]) + ' item header written in ' + str(process_result[1]) +
+                          ' (graphics size: ' + str(file_size) + ' bytes)')
+                    sys.stdout.flush()
+                else:
+                    process_excs_count += 1
+                    sys.stderr.write(str(process_result[0]) + ' error: ' + str(process_result[1]) + '\n')
+                    sys.stderr.flush()
+
+        get_decoded_images_cache(build_folder_path).remove_unreferenced()
+
+        if process_excs_count > 0:
             exit(-1)
 
         print('    ' + 'Processed graphics size: ' + str(total_size) + ' bytes')
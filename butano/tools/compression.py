@@ -0,0 +1,172 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import struct
+
+
+LZ77_MIN_LENGTH = 3
+LZ77_MAX_LENGTH = 18
+LZ77_MIN_DISPLACEMENT = 2  # A displacement of 1 is not VRAM safe.
+LZ77_MAX_DISPLACEMENT = 4096
+LZ77_MAX_CHAIN_LENGTH = 256
+
+RUN_LENGTH_MIN_RUN = 3
+RUN_LENGTH_MAX_RUN = 130
+RUN_LENGTH_MAX_LITERALS = 128
+
+
+def compressed_data_header(compression_type, data_size):
+    if data_size >= 1 << 24:
+        raise ValueError('Data too big to be compressed: ' + str(data_size))
+
+    return bytearray(struct.pack('<I', compression_type | (data_size << 8)))
+
+
+def align_compressed_data(output):
+    extra_bytes = len(output) % 4
+
+    if extra_bytes > 0:
+        output.extend(bytes(4 - extra_bytes))
+
+    return bytes(output)
+
+
+def lz77_compress(data):
+    data = bytes(data)
+    data_size = len(data)
+    output = compressed_data_header(0x10, data_size)
+    heads = {}
+    chain = [-1] * data_size
+    index = 0
+
+    def insert(position):
+        if position + LZ77_MIN_LENGTH <= data_size:
+            key = data[position:position + LZ77_MIN_LENGTH]
+            chain[position] = heads.get(key, -1)
+            heads[key] = position
+
+    while index < data_size:
+        flags_index = len(output)
+        flags = 0
+        output.append(0)
+
+        for block_index in range(8):
+            if index >= data_size:
+                break
+
+            max_length = min(LZ77_MAX_LENGTH, data_size - index)
+            best_length = 0
+            best_displacement = 0
+
+            if max_length >= LZ77_MIN_LENGTH:
+                target = data[index:index + max_length]
+                min_position = index - LZ77_MAX_DISPLACEMENT
+                position = heads.get(data[index:index + LZ77_MIN_LENGTH], -1)
+                chain_length = 0
+
+                while position >= min_position and position >= 0 and chain_length < LZ77_MAX_CHAIN_LENGTH:
+                    displacement = index - position
+
+                    if displacement >= LZ77_MIN_DISPLACEMENT:
+                        # Overlapped matches are fine, the source bytes are already decompressed when they are read:
+                        if data[position:position + max_length] == target:
+                            best_length = max_length
+                            best_displacement = displacement
+                            break
+
+                        length = LZ77_MIN_LENGTH
+
+                        while data[position + length] == target[length]:
+                            length += 1
+
+                        if length > best_length:
+                            best_length = length
+                            best_displacement = displacement
+
+                    position = chain[position]
+                    chain_length += 1
+
+            if best_length >= LZ77_MIN_LENGTH:
+                encoded_displacement = best_displacement - 1
+                flags |= 0x80 >> block_index
+                output.append(((best_length - LZ77_MIN_LENGTH) << 4) | (encoded_displacement >> 8))
+                output.append(encoded_displacement & 0xFF)
+
+                for position in range(index, index + best_length):
+                    insert(position)
+
+                index += best_length
+            else:
+                output.append(data[index])
+                insert(index)
+                index += 1
+
+        output[flags_index] = flags
+
+    return align_compressed_data(output)
+
+
+def run_length_compress(data):
+    data = bytes(data)
+    data_size = len(data)
+    output = compressed_data_header(0x30, data_size)
+    literals_index = 0
+    index = 0
+
+    def write_literals(end_index):
+        start_index = literals_index
+
+        while start_index < end_index:
+            literals_count = min(RUN_LENGTH_MAX_LITERALS, end_index - start_index)
+            output.append(literals_count - 1)
+            output.extend(data[start_index:start_index + literals_count])
+            start_index += literals_count
+
+    while index < data_size:
+        value = data[index]
+        max_run = min(RUN_LENGTH_MAX_RUN, data_size - index)
+        run = 1
+
+        while run < max_run and data[index + run] == value:
+            run += 1
+
+        if run >= RUN_LENGTH_MIN_RUN:
+            write_literals(index)
+            output.append(0x80 | (run - RUN_LENGTH_MIN_RUN))
+            output.append(value)
+            index += run
+            literals_index = index
+        else:
+            index += run
+
+    write_literals(data_size)
+    return align_compressed_data(output)
+
+
+def compress(data, compression):
+    if compression == 'none':
+        return bytes(data)
+
+    if compression == 'lz77':
+        return lz77_compress(data)
+
+    if compression == 'run_length':
+        return run_length_compress(data)
+
+    raise ValueError('Unknown compression: ' + str(compression))
+
+
+def compress_smallest(data):
+    best_compression = None
+    best_compressed_data = None
+
+    for compression in ['none', 'run_length', 'lz77']:
+        compressed_data = compress(data, compression)
+
+        if best_compressed_data is None or len(compressed_data) < len(best_compressed_data):
+            best_compression = compression
+            best_compressed_data = compressed_data
+
+    return best_compression, best_compressed_data
@@ -0,0 +1,96 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import os
+import struct
+
+from output_file import OutputFile
+
+
+class DecodedImagesCache:
+
+    __magic = b'BNDI'
+    __header_format = '<4sII'
+
+    def __init__(self, cache_folder_path):
+        self.__cache_folder_path = cache_folder_path
+
+    def load(self, key):
+        # Returns the cached pixels (one palette index per byte) and colors, or None if they are not found:
+        try:
+            with open(self.__file_path(key), 'rb') as cache_file:
+                data = cache_file.read()
+        except OSError:
+            return None
+
+        header_size = struct.calcsize(DecodedImagesCache.__header_format)
+
+        if len(data) < header_size:
+            return None
+
+        magic, colors_count, pixels_count = struct.unpack_from(DecodedImagesCache.__header_format, data)
+        colors_size = colors_count * 3
+
+        if magic != DecodedImagesCache.__magic or len(data) != header_size + colors_size + pixels_count:
+            return None
+
+        colors_data = data[header_size:header_size + colors_size]
+        colors = [tuple(colors_data[index:index + 3]) for index in range(0, colors_size, 3)]
+        return data[header_size + colors_size:], colors
+
+    def store(self, key, pixels, colors):
+        # Stored with a rename, since items decoding the same image in other processes can store it at the same time:
+        header = struct.pack(DecodedImagesCache.__header_format, DecodedImagesCache.__magic, len(colors), len(pixels))
+        colors_data = bytes(channel for color in colors for channel in color[:3])
+
+        try:
+            os.makedirs(self.__cache_folder_path, exist_ok=True)
+
+            with OutputFile(self.__file_path(key), True) as cache_file:
+                cache_file.write(header + colors_data + pixels)
+        except OSError:
+            pass  # Cache entries are optional.
+
+    def set_reference(self, file_name, key):
+        # Each image file references the entry of its last decoded contents:
+        reference_file_path = os.path.join(self.__cache_folder_path, file_name + '.txt')
+
+        try:
+            with open(reference_file_path, 'r') as reference_file:
+                if reference_file.read() == key:
+                    return
+        except OSError:
+            pass
+
+        try:
+            os.makedirs(self.__cache_folder_path, exist_ok=True)
+
+            with open(reference_file_path, 'w') as reference_file:
+                reference_file.write(key)
+        except OSError:
+            pass  # Cache entries are optional.
+
+    def remove_unreferenced(self):
+        # Entries not referenced by any image file are removed, so the cache doesn't grow with every image edit:
+        referenced_file_names = set()
+        entry_file_paths = []
+
+        try:
+            with os.scandir(self.__cache_folder_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.txt'):
+                        with open(entry.path, 'r') as reference_file:
+                            referenced_file_names.add(reference_file.read() + '.bin')
+                    elif entry.name.endswith('.bin'):
+                        entry_file_paths.append(entry.path)
+
+            for entry_file_path in entry_file_paths:
+                if os.path.basename(entry_file_path) not in referenced_file_names:
+                    os.remove(entry_file_path)
+        except OSError:
+            pass  # Cache entries are optional.
+
+    def __file_path(self, key):
+        return os.path.join(self.__cache_folder_path, key + '.bin')
@@ -3,10 +3,14 @@ Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
 zlib License, see LICENSE file.
 """
 
+import hashlib
 import os
 import string
 
 
+_tools_version = None
+
+
 class FileInfo:
 
     @staticmethod
@@ -51,10 +55,65 @@ class FileInfo:
 
         return FileInfo('\n'.join(info), False)
 
+    @staticmethod
+    def build_from_folders(folder_paths):
+        info = []
+
+        for folder_path in folder_paths:
+            info.append(folder_path)
+
+            with os.scandir(folder_path) as entries:
+                for entry in sorted(entries, key=lambda folder_entry: folder_entry.name):
+                    if entry.is_file():
+                        stat = entry.stat()
+                        info.append(entry.name + ' ' + str(stat.st_size) + ' ' + str(stat.st_mtime_ns))
+
+        return FileInfo('\n'.join(info), False)
+
+    @staticmethod
+    def build_from_contents(file_paths, extra_infos):
+        hasher = hashlib.sha1()
+
+        for file_path in file_paths:
+            with open(file_path, 'rb') as file:
+                content = file.read()
+
+            hasher.update(str(len(content)).encode() + b'\n')
+            hasher.update(content)
+
+        for extra_info in extra_infos:
+            extra_info = extra_info.encode()
+            hasher.update(str(len(extra_info)).encode() + b'\n')
+            hasher.update(extra_info)
+
+        hasher.update(FileInfo.tools_version().encode())
+        return FileInfo(hasher.hexdigest(), False)
+
+    @staticmethod
+    def tools_version():
+        global _tools_version
+
+        if _tools_version is None:
+            hasher = hashlib.sha1()
+            tools_folder_path = os.path.dirname(os.path.abspath(__file__))
+
+            for tool_file_name in sorted(os.listdir(tools_folder_path)):
+                if tool_file_name.endswith('.py'):
+                    with open(os.path.join(tools_folder_path, tool_file_name), 'rb') as tool_file:
+                        hasher.update(tool_file_name.encode() + b'\n')
+                        hasher.update(tool_file.read())
+
+            _tools_version = hasher.hexdigest()
+
+        return _tools_version
+
     def __init__(self, info, read_failed):
         self.__info = info
         self.__read_failed = read_failed
 
+    def info(self):
+        return self.__info
+
     def write(self, file_path):
         with open(file_path, 'w') as file:
             file.write(self.__info)
@@ -1,14 +1,17 @@
+import string
 
-import subprocess
-import re
-
-from util import get_processor, remove_file, compression_label, validate_compression
+from build_trace import traced
+from gfx_converter import image_tiles, regular_map, convert_tiles, convert_palette, convert_map
+from gfx_data import GfxData
+from img_processor import OPTIMAL_STRATEGY_MAX_NODES
+from output_file import OutputFile
+from util import get_processor, compression_label, validate_compression
 
 class FixedBgItem:
 
     def __init__(self, file_path, file_name_no_ext, build_folder_path, info):
-        bmp = get_processor(file_path)
-        self.__file_path = file_path
+        bmp = get_processor(file_path, build_folder_path)
+        self.__bmp = bmp
         self.__file_name_no_ext = file_name_no_ext
         self.__build_folder_path = build_folder_path
 
@@ -74,8 +77,23 @@ class FixedBgItem:
                 if self.__palette_item is not None:
                     raise ValueError('BPP mode not supported with an external palette item: ' + bpp_mode)
 
-                self.__file_path = self.__build_folder_path + '/' + file_name_no_ext + '.bn_quantized.bmp'
-                self.__colors_count = bmp.quantize(self.__file_path)
+                try:
+                    strategy = str(info['bpp_4_auto_strategy'])
+                except KeyError:
+                    strategy = 'greedy'
+
+                if strategy != 'greedy' and strategy != 'optimal':
+                    raise ValueError('Invalid BPP 4 auto strategy: ' + strategy)
+
+                try:
+                    optimal_strategy_max_nodes = int(info['bpp_4_auto_optimal_max_nodes'])
+                except KeyError:
+                    optimal_strategy_max_nodes = OPTIMAL_STRATEGY_MAX_NODES
+
+                if optimal_strategy_max_nodes < 0:
+                    raise ValueError('Invalid BPP 4 auto optimal max nodes: ' + str(optimal_strategy_max_nodes))
+
+                self.__colors_count = bmp.quantize(strategy, optimal_strategy_max_nodes)
             elif bpp_mode != 'bpp_4' and bpp_mode != 'bpp_4_manual':
                 raise ValueError('Invalid BPP mode: ' + bpp_mode)
 
@@ -113,107 +131,30 @@ class FixedBgItem:
                 self.__map_compression = 'none'
 
     def process(self):
-        tiles_compression = self.__tiles_compression
-        palette_compression = self.__palette_compression
-        map_compression = self.__map_compression
-
-        if tiles_compression == 'auto':
-            tiles_compression, file_size = self.__test_tiles_compression(tiles_compression, 'none', None)
-            tiles_compression, file_size = self.__test_tiles_compression(tiles_compression, 'run_length', file_size)
-            tiles_compression, file_size = self.__test_tiles_compression(tiles_compression, 'lz77', file_size)
-
-        if palette_compression == 'auto':
-            palette_compression, file_size = self.__test_palette_compression(palette_compression, 'none', None)
-            palette_compression, file_size = self.__test_palette_compression(palette_compression, 'run_length',
-                                                                             file_size)
-            palette_compression, file_size = self.__test_palette_compression(palette_compression, 'lz77', file_size)
-
-        if map_compression == 'auto':
-            map_compression, file_size = self.__test_map_compression(map_compression, 'none', None)
-            map_compression, file_size = self.__test_map_compression(map_compression, 'run_length', file_size)
-            map_compression, file_size = self.__test_map_compression(map_compression, 'lz77', file_size)
-
-        self.__execute_command(tiles_compression, palette_compression, map_compression)
-        return self.__write_header(tiles_compression, palette_compression, map_compression, False)
-
-    def __test_tiles_compression(self, best_tiles_compression, new_tiles_compression, best_file_size):
-        self.__execute_command(new_tiles_compression, 'none', 'none')
-        new_file_size = self.__write_header(new_tiles_compression, 'none', 'none', True)
-
-        if best_file_size is None or new_file_size < best_file_size:
-            return new_tiles_compression, new_file_size
-
-        return best_tiles_compression, best_file_size
-
-    def __test_palette_compression(self, best_palette_compression, new_palette_compression, best_file_size):
-        self.__execute_command('none', new_palette_compression, 'none')
-        new_file_size = self.__write_header('none', new_palette_compression, 'none', True)
-
-        if best_file_size is None or new_file_size < best_file_size:
-            return new_palette_compression, new_file_size
-
-        return best_palette_compression, best_file_size
-
-    def __test_map_compression(self, best_map_compression, new_map_compression, best_file_size):
-        self.__execute_command('none', 'none', new_map_compression)
-        new_file_size = self.__write_header('none', 'none', new_map_compression, True)
-
-        if best_file_size is None or new_file_size < best_file_size:
-            return new_map_compression, new_file_size
-
-        return best_map_compression, best_file_size
-
-    def __write_header(self, tiles_compression, palette_compression, map_compression, skip_write):
+        gfx_data, tiles_count = self.__build_gfx_data()
+        tiles_compression = gfx_data.compress('Tiles', self.__tiles_compression)
+        palette_compression = gfx_data.compress('Pal', self.__palette_compression)
+        map_compression = gfx_data.compress('Map', self.__map_compression)
+        gfx_data.write()
+        return self.__write_header(gfx_data, tiles_count, tiles_compression, palette_compression, map_compression)
+
+    @traced
+    def __write_header(self, gfx_data, tiles_count, tiles_compression, palette_compression, map_compression):
         name = self.__file_name_no_ext
-        grit_file_path = self.__build_folder_path + '/' + name + '_bn_gfx.h'
         header_file_path = self.__build_folder_path + '/bn_fixed_bg_items_' + name + '.h'
 
-        with open(grit_file_path, 'r') as grit_file:
-            grit_data = grit_file.read()
-            grit_data = grit_data.replace('unsigned int', 'bn::tile', 1)
-            grit_data = grit_data.replace('unsigned short', 'bn::fixed_bg_map_cell', 1)
-
-            if self.__palette_item is None:
-                grit_data = grit_data.replace('unsigned short', 'bn::color', 1)
-
-            for grit_line in grit_data.splitlines():
-                if ' tiles ' in grit_line:
-                    for grit_word in grit_line.split():
-                        try:
-                            tiles_count = int(grit_word)
-                            break
-                        except ValueError:
-                            pass
-
-                    if tiles_count > 1024:
-                        raise ValueError('Regular BGs with more than 1024 tiles not supported: ' + str(tiles_count))
-
-                if 'Total size:' in grit_line:
-                    total_size = int(grit_line.split()[-1])
-
-                    if skip_write:
-                        return total_size
-                    else:
-                        break
-
-        remove_file(grit_file_path)
-
         if self.__bpp_8:
             bpp_mode_label = 'bpp_mode::BPP_8'
-            tiles_count *= 2
         else:
             bpp_mode_label = 'bpp_mode::BPP_4'
 
-        grit_data = re.sub(r'Tiles\[([0-9]+)]', 'Tiles[' + str(tiles_count) + ']', grit_data)
-        grit_data = re.sub(r'Pal\[([0-9]+)]', 'Pal[' + str(self.__colors_count) + ']', grit_data)
-
-        with open(header_file_path, 'w') as header_file:
+        with OutputFile(header_file_path) as header_file:
             include_guard = 'BN_REGULAR_BG_ITEMS_' + name.upper() + '_H'
             header_file.write('#ifndef ' + include_guard + '\n')
             header_file.write('#define ' + include_guard + '\n')
             header_file.write('\n')
             header_file.write('#include "bn_regular_bg_item.h"' + '\n')
-            header_file.write(grit_data)
+            header_file.write(gfx_data.declarations())
             header_file.write('\n')
 
             if self.__palette_item is not None:
@@ -242,63 +183,24 @@ class FixedBgItem:
             header_file.write('#endif' + '\n')
             header_file.write('\n')
 
-        return total_size, header_file_path
+        return gfx_data.total_size(), header_file_path
 
-    def __execute_command(self, tiles_compression, palette_compression, map_compression):
-        command = ['grit', self.__file_path]
+    @traced
+    def __build_gfx_data(self):
+        pixels, colors = self.__bmp.decode()
+        tiles = image_tiles(pixels, self.__width * 8, self.__height * 8)
+        tiles, cells = regular_map(tiles, self.__bpp_8, self.__repeated_tiles_reduction,
+                                   self.__flipped_tiles_reduction)
 
-        if self.__colors_count > 0:
-            command.append('-pe' + str(self.__colors_count))
-        else:
-            command.append('-p!')
+        tiles_data = convert_tiles(tiles, self.__bpp_8)
+        tiles_count = len(tiles_data) // 32
+        gfx_data = GfxData(self.__build_folder_path + '/' + self.__file_name_no_ext + '_bn_gfx')
+        gfx_data.add_block('Tiles', 'bn::tile', 4, tiles_data, tiles_count)
 
-        if self.__bpp_8:
-            command.append('-gB8')
-
-            if self.__repeated_tiles_reduction and self.__flipped_tiles_reduction:
-                command.append('-mRtf')
-            elif self.__repeated_tiles_reduction:
-                command.append('-mRt')
-            elif self.__flipped_tiles_reduction:
-                command.append('-mRf')
-            else:
-                command.append('-mR!')
-        else:
-            command.append('-gB4')
-
-            if self.__repeated_tiles_reduction and self.__flipped_tiles_reduction:
-                command.append('-mRtpf')
-            elif self.__repeated_tiles_reduction:
-                command.append('-mRtp')
-            elif self.__flipped_tiles_reduction:
-                command.append('-mRpf')
-            else:
-                command.append('-mRp')
-
-        if self.__sbb:
-            command.append('-mLs')
-        else:
-            command.append('-mLf')
-
-        if tiles_compression == 'lz77':
-            command.append('-gzl')
-        elif tiles_compression == 'run_length':
-            command.append('-gzr')
-
-        if palette_compression == 'lz77':
-            command.append('-pzl')
-        elif palette_compression == 'run_length':
-            command.append('-pzr')
-
-        if map_compression == 'lz77':
-            command.append('-mzl')
-        elif map_compression == 'run_length':
-            command.append('-mzr')
-
-        command.append('-o' + self.__build_folder_path + '/' + self.__file_name_no_ext + '_bn_gfx')
-        command = ' '.join(command)
+        if self.__colors_count > 0:
+            gfx_data.add_block('Pal', 'bn::color', 2, convert_palette(colors, self.__colors_count),
+                               self.__colors_count)
 
-        try:
-            subprocess.check_output(command, shell=True, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            raise ValueError('grit call failed (return code ' + str(e.returncode) + '): ' + str(e.output))
+        gfx_data.add_block('Map', 'bn::fixed_bg_map_cell', 2,
+                           convert_map(cells, self.__width, self.__height, self.__sbb, 'H'))
+        return gfx_data, tiles_count
@@ -0,0 +1,152 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import struct
+
+
+def convert_palette(colors, colors_count):
+    data = bytearray(colors_count * 2)
+
+    for index, color in enumerate(colors[:colors_count]):
+        red, green, blue = color[0], color[1], color[2]
+        struct.pack_into('<H', data, index * 2, (red >> 3) | ((green >> 3) << 5) | ((blue >> 3) << 10))
+
+    return bytes(data)
+
+
+def image_tiles(pixels, width, height):
+    tiles = []
+
+    for tile_y in range(0, height, 8):
+        for tile_x in range(0, width, 8):
+            tile = bytearray()
+
+            for y in range(tile_y, tile_y + 8):
+                row = (width * y) + tile_x
+                tile.extend(pixels[row:row + 8])
+
+            tiles.append(bytes(tile))
+
+    return tiles
+
+
+def convert_tiles(tiles, bpp_8):
+    data = bytearray()
+
+    if bpp_8:
+        for tile in tiles:
+            data.extend(tile)
+    else:
+        for tile in tiles:
+            data.extend(((tile[index + 1] & 15) << 4) | (tile[index] & 15) for index in range(0, 64, 2))
+
+    return bytes(data)
+
+
+REGULAR_BG_MAX_TILES_COUNT = 1024
+AFFINE_BG_MAX_TILES_COUNT = 256
+
+def horizontal_flip(tile):
+    return vertical_flip(tile)[::-1]
+
+
+def vertical_flip(tile):
+    return b''.join(tile[row:row + 8] for row in range(56, -8, -8))
+
+
+def canonical_tile(tile):
+    # Returns the smallest of the tile and its flipped variants, and the flip needed to get it from the tile.
+    # Flips are involutions that commute, so two tiles with the same canonical key are related by the XOR of their
+    # flips:
+    vertical_flip_tile = vertical_flip(tile)
+    variants = (tile, vertical_flip_tile[::-1], vertical_flip_tile, tile[::-1])
+    key = min(variants)
+    return key, variants.index(key)
+
+
+def regular_map(tiles, bpp_8, repeated_tiles_reduction, flipped_tiles_reduction):
+    palette_mask = bytes(range(256)) if bpp_8 else bytes(index & 15 for index in range(256))
+    unique_tiles = []
+    unique_tiles_map = {}
+    cells = []
+
+    for tile in tiles:
+        palette_bank = 0 if bpp_8 else max(tile) >> 4
+        tile = tile.translate(palette_mask)
+
+        if flipped_tiles_reduction:
+            key, flip = canonical_tile(tile)
+        else:
+            key, flip = tile, 0
+
+        cell = None
+        unique_tile = unique_tiles_map.get(key)
+
+        if unique_tile is not None:
+            unique_tile_index, unique_tile_flip = unique_tile
+            cell_flip = flip ^ unique_tile_flip
+
+            if cell_flip or repeated_tiles_reduction:
+                cell = unique_tile_index | (cell_flip << 10)
+
+        if cell is None:
+            cell = len(unique_tiles)
+
+            if cell == REGULAR_BG_MAX_TILES_COUNT:
+                raise ValueError('Regular BGs with more than ' + str(REGULAR_BG_MAX_TILES_COUNT) +
+                                 ' tiles not supported')
+
+            unique_tiles.append(tile)
+
+            if unique_tile is None:
+                unique_tiles_map[key] = (cell, flip)
+
+        cells.append(cell | (palette_bank << 12))
+
+    return unique_tiles, cells
+
+
+def affine_map(tiles, repeated_tiles_reduction):
+    unique_tiles = []
+    unique_tiles_map = {}
+    cells = []
+
+    for tile in tiles:
+        cell = None
+
+        if repeated_tiles_reduction:
+            cell = unique_tiles_map.get(tile)
+
+        if cell is None:
+            cell = len(unique_tiles)
+
+            if cell == AFFINE_BG_MAX_TILES_COUNT:
+                raise ValueError('Affine BGs with more than ' + str(AFFINE_BG_MAX_TILES_COUNT) +
+                                 ' tiles not supported')
+
+            unique_tiles.append(tile)
+            unique_tiles_map.setdefault(tile, cell)
+
+        cells.append(cell)
+
+    return unique_tiles, cells
+
+
+def convert_map(cells, width, height, sbb, cell_format):
+    # cell_format is a struct format character ('H' for regular maps and 'B' for affine maps).
+    if sbb:
+        sorted_cells = []
+
+        for sbb_y in range(0, height, 32):
+            for sbb_x in range(0, width, 32):
+                sbb_width = min(32, width - sbb_x)
+
+                for y in range(sbb_y, min(sbb_y + 32, height)):
+                    row = (width * y) + sbb_x
+                    sorted_cells.extend(cells[row:row + sbb_width])
+
+        cells = sorted_cells
+
+    return struct.pack('<' + str(len(cells)) + cell_format, *cells)
@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+from build_trace import Span, traced
+from compression import compress, compress_smallest
+from output_file import OutputFile
+
+
+class GfxData:
+
+    __unit_directives = {1: '.byte', 2: '.hword', 4: '.word'}
+    __values_per_line = {1: 16, 2: 16, 4: 8}
+
+    def __init__(self, file_path_no_ext):
+        self.__file_path_no_ext = file_path_no_ext
+        self.__name = file_path_no_ext.split('/')[-1]
+        self.__blocks = []
+
+    def add_block(self, block_suffix, c_type, unit_size, data, count=None):
+        self.__blocks.append([self.__name + block_suffix, c_type, unit_size, data, count])
+
+    def compress(self, block_suffix, compression):
+        label = self.__name + block_suffix
+
+        for block in self.__blocks:
+            if block[0] == label:
+                with Span('compress', {'block': block_suffix, 'compression': compression}):
+                    if compression == 'auto':
+                        compression, block[3] = compress_smallest(block[3])
+                    else:
+                        block[3] = compress(block[3], compression)
+
+                return compression
+
+        if compression == 'auto':
+            return 'none'
+
+        return compression
+
+    def total_size(self):
+        return sum(len(block[3]) for block in self.__blocks)
+
+    @traced
+    def write(self):
+        name = self.__name
+
+        with OutputFile(self.__file_path_no_ext + '.s') as s_file:
+            s_file.write('@{{BLOCK(' + name + ')' + '\n')
+
+            for label, c_type, unit_size, block_data, count in self.__blocks:
+                values_per_line = GfxData.__values_per_line[unit_size]
+                value_format = '0x%0' + str(unit_size * 2) + 'X'
+                values = [value_format % int.from_bytes(block_data[index:index + unit_size], 'little')
+                          for index in range(0, len(block_data), unit_size)]
+
+                s_file.write('\n')
+                s_file.write('\t.section .rodata' + '\n')
+                s_file.write('\t.align\t2' + '\n')
+                s_file.write('\t.global ' + label + '\t\t@ ' + str(len(block_data)) + ' unsigned chars' + '\n')
+                s_file.write('\t.hidden ' + label + '\n')
+                s_file.write(label + ':' + '\n')
+
+                for index in range(0, len(values), values_per_line):
+                    s_file.write('\t' + GfxData.__unit_directives[unit_size] + ' ' +
+                                 ','.join(values[index:index + values_per_line]) + '\n')
+
+            s_file.write('\n')
+            s_file.write('@}}BLOCK(' + name + ')' + '\n')
+
+    def declarations(self):
+        declarations = ['', '//\t' + self.__name + ', total size: ' + str(self.total_size()), '']
+
+        for label, c_type, unit_size, block_data, count in self.__blocks:
+            if count is None:
+                count = len(block_data) // unit_size
+
+            declarations.append('#define ' + label + 'Len ' + str(len(block_data)))
+            declarations.append('extern const ' + c_type + ' ' + label + '[' + str(count) + '];')
+            declarations.append('')
+
+        return '\n'.join(declarations)
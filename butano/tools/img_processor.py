@@ -1,131 +1,150 @@
+import heapq
+import os
+from abc import ABC, abstractmethod
 
+from build_trace import Span, traced
+from file_info import FileInfo
+from gfx_converter import image_tiles
 
-class ImageProcessor:
-    def __init__(self, file_path):
+# Maximum number of search nodes visited by the optimal bpp_4_auto strategy looking for fewer palettes than the greedy
+# one. A node count is used instead of a time limit, so the result doesn't depend on the speed of the machine:
+OPTIMAL_STRATEGY_MAX_NODES = 100000
+
+
+class ImageProcessor(ABC):
+    def __init__(self, file_path, decoded_images_cache=None):
         self.width = None
         self.height = None
-        self.colors_count = None
         self.__file_path = file_path
-
-    def quantize(self, output_file_path):
+        self.__decoded_images_cache = decoded_images_cache
+        self.__colors_count = None
+        self.__decoded = None
+
+    @property
+    def colors_count(self):
+        # Calculating the colors count can require decoding the pixels, so it is done on first access:
+        if self.__colors_count is None:
+            self.__colors_count = self.calculate_colors_count()
+
+        return self.__colors_count
+
+    @abstractmethod
+    def calculate_colors_count(self):
+        pass
+
+    def decode(self):
+        # Returns the palette index of each pixel (from top to bottom, one byte per pixel) and the palette colors.
+        # Pixels are decoded on first call:
+        if self.__decoded is None:
+            with Span('decode'):
+                if self.__decoded_images_cache is None:
+                    self.__decoded = self.decode_pixels()
+                else:
+                    self.__decoded = self.__decode_pixels_cached()
+
+        return self.__decoded
+
+    @abstractmethod
+    def decode_pixels(self):
+        pass
+
+    def __decode_pixels_cached(self):
+        # Decoded images are stored by content, so identical images are decoded once:
+        key = FileInfo.build_from_contents([self.__file_path], []).info()
+        decoded = self.__decoded_images_cache.load(key)
+
+        if decoded is None or len(decoded[0]) != self.width * self.height:
+            decoded = self.decode_pixels()
+            self.__decoded_images_cache.store(key, decoded[0], decoded[1])
+
+        self.__decoded_images_cache.set_reference(os.path.basename(self.__file_path), key)
+        return decoded
+
+    @traced
+    def quantize(self, strategy='greedy', optimal_strategy_max_nodes=OPTIMAL_STRATEGY_MAX_NODES):
+        # Rearranges the palette and the pixels so each tile uses only one 16 colors palette bank.
+        # Returns the new colors count; the quantized pixels and colors are returned by decode() afterwards:
         if self.colors_count == 16:
-            shutil.copyfile(self.__file_path, output_file_path)
             return 16
 
         width = self.width
         height = self.height
-        colors = self.__colors
-        pixels = self.__pixels
-
-        # Store used pixels for all tiles:
+        pixels, colors = self.decode()
+
+        # Store used pixels for all tiles as bitmasks (bit N set if pixel N is used), from bottom to top:
+        columns = width // 8
+        tiles = image_tiles(pixels, width, height)
+        tile_indexes = [(tile_row * columns) + column
+                        for tile_row in range((height // 8) - 1, -1, -1) for column in range(columns)]
+        tile_masks = {}
         tile_pixel_sets = []
 
-        for ty in range(0, height, 8):
-            for tx in range(0, width, 8):
-                new_tile_pixel_set = set()
+        for tile_index in tile_indexes:
+            tile = tiles[tile_index]
 
-                for y in range(ty, ty + 8):
-                    row = width * y
+            if tile in tile_masks:
+                continue
 
-                    for x in range(tx, tx + 8):
-                        pixel = pixels[row + x]
+            new_tile_pixel_set = 0
 
-                        if pixel > 0:
-                            new_tile_pixel_set.add(pixel)
+            for pixel in set(tile):
+                new_tile_pixel_set |= 1 << pixel
 
-                new_tile_pixel_set_len = len(new_tile_pixel_set)
+            new_tile_pixel_set &= ~1
+            tile_masks[tile] = new_tile_pixel_set
+            new_tile_pixel_set_len = _bits_count(new_tile_pixel_set)
 
-                if new_tile_pixel_set_len > 0:
-                    if new_tile_pixel_set_len > 15:
-                        raise ValueError('There\'s a tile with more than 15 colors: ' + str(tx) + ' - ' +
-                                         str(height - ty - 8) + ' - ' + str(new_tile_pixel_set_len) + ': ' +
-                                         str(new_tile_pixel_set))
+            if new_tile_pixel_set_len > 0:
+                if new_tile_pixel_set_len > 15:
+                    raise ValueError('There\'s a tile with more than 15 colors: ' + str((tile_index % columns) * 8) +
+                                     ' - ' + str((tile_index // columns) * 8) + ' - ' + str(new_tile_pixel_set_len) +
+                                     ': ' + str(set(_bits(new_tile_pixel_set))))
 
-                    append = True
+                append = True
 
-                    for tile_pixel_set in tile_pixel_sets:
-                        if new_tile_pixel_set.issubset(tile_pixel_set):
-                            append = False
-                            break
+                for tile_pixel_set in tile_pixel_sets:
+                    if new_tile_pixel_set | tile_pixel_set == tile_pixel_set:
+                        append = False
+                        break
 
-                    if append:
-                        tile_pixel_sets.append(new_tile_pixel_set)
+                if append:
+                    tile_pixel_sets.append(new_tile_pixel_set)
 
         tile_pixel_sets_count = len(tile_pixel_sets)
 
         if tile_pixel_sets_count == 0:
-            shutil.copyfile(self.__file_path, output_file_path)
             return 16
 
         # Merge pixel sets:
-        while True:
-            minimum_i = None
-            minimum_j = None
-            minimum_u_set = None
-            minimum_u_set_length = 16
-            merged = False
-            i = 0
-
-            while i < tile_pixel_sets_count - 1:
-                i_set = tile_pixel_sets[i]
-                i_set_length = len(i_set)
-                j = i + 1
-
-                while j < tile_pixel_sets_count:
-                    j_set = tile_pixel_sets[j]
-                    j_set_length = len(j_set)
-                    u_set = i_set.union(j_set)
-                    u_set_length = len(u_set)
-
-                    if u_set_length == i_set_length or u_set_length == j_set_length:
-                        if u_set_length == j_set_length:
-                            tile_pixel_sets[i] = j_set
-                            i_set = j_set
-                            i_set_length = j_set_length
-
-                        tile_pixel_sets.pop(j)
-                        j -= 1
-                        tile_pixel_sets_count -= 1
-                        minimum_u_set = None
-                        minimum_i = None
-                        minimum_j = None
-                        minimum_u_set_length = 16
-                        merged = True
-                    elif not merged and u_set_length < minimum_u_set_length:
-                        minimum_u_set = u_set
-                        minimum_i = i
-                        minimum_j = j
-                        minimum_u_set_length = u_set_length
-
-                    j += 1
-
-                i += 1
-
-            if minimum_u_set is not None:
-                if minimum_i < minimum_j:
-                    minimum_i, minimum_j = minimum_j, minimum_i
-
-                tile_pixel_sets[minimum_i] = minimum_u_set
-                tile_pixel_sets.pop(minimum_j)
-                tile_pixel_sets_count -= 1
-            elif not merged:
-                break
+        tile_pixel_sets = _remove_tile_pixel_subsets(tile_pixel_sets)
+        merged_tile_pixel_sets = _merge_tile_pixel_sets(list(tile_pixel_sets))
+
+        if strategy == 'optimal':
+            packed_tile_pixel_sets = _pack_tile_pixel_sets(tile_pixel_sets, len(merged_tile_pixel_sets),
+                                                           optimal_strategy_max_nodes)
+
+            if packed_tile_pixel_sets is not None:
+                merged_tile_pixel_sets = packed_tile_pixel_sets
+
+        tile_pixel_sets = merged_tile_pixel_sets
+        tile_pixel_sets_count = len(tile_pixel_sets)
 
         if tile_pixel_sets_count > 16:
             raise ValueError('There\'s more than 16 4bpp palettes: ' + str(tile_pixel_sets_count))
 
         # Generate new colors:
         transparent_color = colors[0]
+        tile_pixel_lists = [_bits(tile_pixel_set) for tile_pixel_set in tile_pixel_sets]
 
         for i in range(tile_pixel_sets_count):
-            for i_pixel in tile_pixel_sets[i]:
+            for i_pixel in tile_pixel_lists[i]:
                 i_color = colors[i_pixel]
 
                 if i_color == transparent_color:
                     raise ValueError('There\'s an used color like the transparent one in: ' + str(i_pixel))
 
                 for j in range(i + 1, tile_pixel_sets_count):
-                    for j_pixel in tile_pixel_sets[j]:
+                    for j_pixel in tile_pixel_lists[j]:
                         if i_pixel != j_pixel and i_color == colors[j_pixel]:
                             raise ValueError('There\'s two used identical colors in: ' + str(i_pixel) + ' and ' +
                                              str(j_pixel))
@@ -133,84 +152,269 @@ class ImageProcessor:
         new_colors = [transparent_color] * 256
 
         for tpi in range(tile_pixel_sets_count):
-            new_tile_pixel_set = tile_pixel_sets[tpi]
             ci = (tpi * 16) + 1
 
-            for tile_pixel in new_tile_pixel_set:
+            for tile_pixel in tile_pixel_lists[tpi]:
                 new_colors[ci] = colors[tile_pixel]
                 ci += 1
 
-        # Generate new pixels:
-        new_pixels = list(pixels)
-        tile_pixel_lists = []
+        # Generate new pixels, remapping each tile with the lookup table of its palette:
+        palette_tables = []
+
+        for tpi in range(tile_pixel_sets_count):
+            palette_table = bytearray(256)
+            palette_table[0] = tpi * 16
+
+            for tile_pixel_index, tile_pixel in enumerate(tile_pixel_lists[tpi]):
+                palette_table[tile_pixel] = (tpi * 16) + tile_pixel_index + 1
+
+            palette_tables.append(bytes(palette_table))
 
-        for new_tile_pixel_set in tile_pixel_sets:
-            tile_pixel_lists.append(list(new_tile_pixel_set))
+        new_pixels = bytearray(len(pixels))
+        new_tiles = {}
 
-        for ty in range(0, height, 8):
-            for tx in range(0, width, 8):
-                valid_tile_pixel_set = False
+        for tile_index in tile_indexes:
+            tile = tiles[tile_index]
+            new_tile = new_tiles.get(tile)
+
+            if new_tile is None:
+                tile_pixel_set = tile_masks[tile]
 
                 for tpi in range(tile_pixel_sets_count):
                     new_tile_pixel_set = tile_pixel_sets[tpi]
-                    valid_tile_pixel_set = True
 
-                    for y in range(ty, ty + 8):
-                        row = width * y
+                    if tile_pixel_set | new_tile_pixel_set == new_tile_pixel_set:
+                        new_tile = tile.translate(palette_tables[tpi])
+                        new_tiles[tile] = new_tile
+                        break
+                else:
+                    raise ValueError('No valid palette found for tile: ' + str((tile_index % columns) * 8) + ' - ' +
+                                     str((tile_index // columns) * 8))
+
+            offset = (width * (tile_index // columns) * 8) + ((tile_index % columns) * 8)
 
-                        for x in range(tx, tx + 8):
-                            pixel = pixels[row + x]
+            for y in range(0, 64, 8):
+                new_pixels[offset:offset + 8] = new_tile[y:y + 8]
+                offset += width
 
-                            if pixel > 0:
-                                if pixel not in new_tile_pixel_set:
-                                    valid_tile_pixel_set = False
-                                    break
+        self.__decoded = (bytes(new_pixels), new_colors)
+        self.__colors_count = tile_pixel_sets_count * 16
+        return self.__colors_count
 
-                        if not valid_tile_pixel_set:
-                            break
 
-                    if valid_tile_pixel_set:
-                        tile_pixel_list = tile_pixel_lists[tpi]
+def _remove_tile_pixel_subsets(tile_pixel_sets):
+    # Removes the sets contained in other ones.
+    # A superset takes the position of the first set it contains if that set comes before it:
+    tile_pixel_sets_count = len(tile_pixel_sets)
+    merged = True
 
-                        for y in range(ty, ty + 8):
-                            row = width * y
+    while merged:
+        merged = False
+        i = 0
 
-                            for x in range(tx, tx + 8):
-                                pixel = pixels[row + x]
-                                new_pixel = tpi * 16
+        while i < tile_pixel_sets_count - 1:
+            i_set = tile_pixel_sets[i]
+            j = i + 1
 
-                                if pixel > 0:
-                                    new_pixel += tile_pixel_list.index(pixel) + 1
+            while j < tile_pixel_sets_count:
+                j_set = tile_pixel_sets[j]
+                u_set = i_set | j_set
 
-                                new_pixels[row + x] = new_pixel
+                if u_set == i_set or u_set == j_set:
+                    if u_set == j_set:
+                        tile_pixel_sets[i] = j_set
+                        i_set = j_set
 
-                        break
+                    tile_pixel_sets.pop(j)
+                    j -= 1
+                    tile_pixel_sets_count -= 1
+                    merged = True
+
+                j += 1
+
+            i += 1
+
+    return tile_pixel_sets
+
+
+def _merge_tile_pixel_sets(tile_pixel_sets):
+    # Greedily merges the pair of sets with the smallest union (up to 15 colors) until there's no pair left,
+    # removing the sets contained in each new union. The given sets must not contain each other.
+    # Ties are broken by the position of the sets in the list.
+    #
+    # Candidate pairs are stored in a heap. Pairs with merged or removed sets are discarded when they are popped,
+    # so only the pairs of a new union need to be calculated after each merge.
+    orders = list(range(len(tile_pixel_sets)))
+    alive_sets = dict(enumerate(tile_pixel_sets))
+    pairs = []
+
+    for i, i_set in enumerate(tile_pixel_sets):
+        for j in range(i + 1, len(tile_pixel_sets)):
+            u_set = i_set | tile_pixel_sets[j]
+            u_set_length = _bits_count(u_set)
+
+            if u_set_length < 16:
+                pairs.append((u_set_length, i, j, i, j, u_set))
+
+    heapq.heapify(pairs)
+
+    while pairs:
+        u_set_length, i_order, j_order, i, j, u_set = heapq.heappop(pairs)
+
+        if i not in alive_sets or j not in alive_sets:
+            continue
+
+        # The union takes the position of the second set, or the position of the first set it contains:
+        del alive_sets[i]
+        del alive_sets[j]
+        u_order = j_order
+
+        for k, k_set in list(alive_sets.items()):
+            if k_set | u_set == u_set:
+                u_order = min(u_order, orders[k])
+                del alive_sets[k]
+
+        u = len(orders)
+        orders.append(u_order)
+
+        for k, k_set in alive_sets.items():
+            ku_set = k_set | u_set
+            ku_set_length = _bits_count(ku_set)
+
+            if ku_set_length < 16:
+                k_order = orders[k]
+
+                if k_order < u_order:
+                    heapq.heappush(pairs, (ku_set_length, k_order, u_order, k, u, ku_set))
+                else:
+                    heapq.heappush(pairs, (ku_set_length, u_order, k_order, u, k, ku_set))
+
+        alive_sets[u] = u_set
+
+    return [alive_sets[k] for k in sorted(alive_sets, key=orders.__getitem__)]
+
+
+def _pack_tile_pixel_sets(tile_pixel_sets, palettes_count, max_nodes):
+    # Branch and bound search of a packing of the sets in less than palettes_count palettes of up to 15 colors.
+    # Returns the palettes of the best packing found visiting up to max_nodes nodes, or None if no better packing was
+    # found.
+    tile_pixel_sets = sorted(tile_pixel_sets, key=_bits_count, reverse=True)
+    tile_pixel_sets_count = len(tile_pixel_sets)
+    remaining_colors = [0] * (tile_pixel_sets_count + 1)
+
+    for index in range(tile_pixel_sets_count - 1, -1, -1):
+        remaining_colors[index] = remaining_colors[index + 1] | tile_pixel_sets[index]
+
+    minimum_palettes_count = max(1, -(-_bits_count(remaining_colors[0]) // 15))
+    best_palettes = None
+    best_palettes_count = palettes_count
+    palettes = []
+    nodes = 0
+
+    def candidates(index):
+        # Palettes where the set can be added, plus -1 for a new palette, sorted by the number of new colors:
+        used_colors = 0
+        free_colors = 0
+
+        for palette in palettes:
+            used_colors |= palette
+            free_colors += 15 - _bits_count(palette)
+
+        new_colors = _bits_count(remaining_colors[index] & ~used_colors)
+        required_palettes_count = len(palettes) + -(-max(0, new_colors - free_colors) // 15)
+
+        if required_palettes_count >= best_palettes_count:
+            return []
+
+        tile_pixel_set = tile_pixel_sets[index]
+        result = []
+
+        for palette_index, palette in enumerate(palettes):
+            u_palette_length = _bits_count(palette | tile_pixel_set)
+
+            if u_palette_length <= 15:
+                added_colors = u_palette_length - _bits_count(palette)
+
+                if added_colors == 0:
+                    # Adding the set to a palette that already contains it can't be worse than any other option:
+                    return [palette_index]
+
+                result.append((added_colors, palette_index))
+
+        result.sort()
+        result = [palette_index for added_colors, palette_index in result]
+        result.append(-1)
+        return result
+
+    # Each frame stores the candidates of a set, the index of the next one to try and how to undo the last one:
+    frames = [[candidates(0), 0, None]]
+
+    while frames:
+        frame = frames[-1]
+        undo = frame[2]
+
+        if undo is not None:
+            if undo[0] < 0:
+                palettes.pop()
+            else:
+                palettes[undo[0]] = undo[1]
+
+            frame[2] = None
+
+        frame_candidates, candidate_index = frame[0], frame[1]
+
+        if candidate_index == len(frame_candidates):
+            frames.pop()
+            continue
+
+        nodes += 1
+
+        if nodes > max_nodes:
+            break
+
+        frame[1] = candidate_index + 1
+        palette_index = frame_candidates[candidate_index]
+        tile_pixel_set = tile_pixel_sets[len(frames) - 1]
+
+        if palette_index < 0:
+            if len(palettes) + 1 >= best_palettes_count:
+                continue
+
+            palettes.append(tile_pixel_set)
+            frame[2] = (-1, None)
+        else:
+            frame[2] = (palette_index, palettes[palette_index])
+            palettes[palette_index] |= tile_pixel_set
+
+        if len(frames) == tile_pixel_sets_count:
+            best_palettes = list(palettes)
+            best_palettes_count = len(palettes)
+
+            if best_palettes_count <= minimum_palettes_count:
+                break
+        else:
+            frames.append([candidates(len(frames)), 0, None])
 
-                if not valid_tile_pixel_set:
-                    raise ValueError('No valid palette found for tile: ' + str(tx) + ' - ' + str(height - ty - 8))
+    return best_palettes
 
-        # Write output file:
-        with open(self.__file_path, 'rb') as input_file:
-            input_file_content = input_file.read()
-            b = bytearray()
-            b.extend(input_file_content)
-            input_file_content = b
-            offset = self.__colors_offset
 
-            for new_color in new_colors:
-                new_color_bytes = struct.unpack('4B', struct.pack('I', new_color))
+try:
+    _bits_count = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _bits_count(bits):
+        return bin(bits).count('1')
 
-                for new_color_byte in new_color_bytes:
-                    input_file_content[offset] = new_color_byte
-                    offset += 1
 
-            offset = self.__pixels_offset
+def _bits(bits):
+    # Returns the indexes of the set bits in ascending order:
+    result = []
+    index = 0
 
-            for new_pixel in new_pixels:
-                input_file_content[offset] = new_pixel
-                offset += 1
+    while bits:
+        if bits & 1:
+            result.append(index)
 
-            with open(output_file_path, 'wb') as output_file:
-                output_file.write(input_file_content)
+        bits >>= 1
+        index += 1
 
-        return tile_pixel_sets_count * 16
+    return result
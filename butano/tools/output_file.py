@@ -0,0 +1,88 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import filecmp
+import os
+import shutil
+import stat
+import tempfile
+
+
+# The process umask can only be read by setting it:
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+class OutputFile:
+    """
+    File which replaces the given one when closed only if their contents are different, so the modification
+    time of unchanged generated files is kept and make doesn't rebuild what depends on them.
+    """
+
+    def __init__(self, file_path, binary=False):
+        self.__file_path = file_path
+        self.__binary = binary
+        self.__temp_file = None
+        self.__temp_file_path = None
+
+    def __enter__(self):
+        temp_file_descriptor, self.__temp_file_path = _create_temp_file(self.__file_path)
+        self.__temp_file = os.fdopen(temp_file_descriptor, 'wb' if self.__binary else 'w')
+        return self.__temp_file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__temp_file.close()
+
+        if exc_type is None:
+            _replace_file(self.__temp_file_path, self.__file_path)
+        else:
+            os.remove(self.__temp_file_path)
+
+        return False
+
+
+def copy_output_file(source_file_path, file_path):
+    if os.path.isfile(file_path) and filecmp.cmp(source_file_path, file_path, shallow=False):
+        return
+
+    temp_file_descriptor, temp_file_path = _create_temp_file(file_path)
+    os.close(temp_file_descriptor)
+
+    try:
+        shutil.copyfile(source_file_path, temp_file_path)
+    except OSError:
+        os.remove(temp_file_path)
+        raise
+
+    os.replace(temp_file_path, file_path)
+
+
+def create_temp_folder(parent_folder_path):
+    # mkdtemp creates folders only accessible by their owner:
+    temp_folder_path = tempfile.mkdtemp(prefix='_bn_', dir=parent_folder_path)
+    os.chmod(temp_folder_path, 0o777 & ~_umask)
+    return temp_folder_path
+
+
+def _create_temp_file(file_path):
+    # mkstemp creates files only accessible by their owner, so they get the mode of the replaced file instead,
+    # or the default one if there's no file to replace:
+    temp_file_descriptor, temp_file_path = tempfile.mkstemp(prefix='_bn_',
+                                                            dir=os.path.dirname(os.path.abspath(file_path)))
+
+    try:
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except OSError:
+        mode = 0o666 & ~_umask
+
+    os.chmod(temp_file_path, mode)
+    return temp_file_descriptor, temp_file_path
+
+
+def _replace_file(temp_file_path, file_path):
+    if os.path.isfile(file_path) and filecmp.cmp(temp_file_path, file_path, shallow=False):
+        os.remove(temp_file_path)
+    else:
+        os.replace(temp_file_path, file_path)
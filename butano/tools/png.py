@@ -186,6 +186,12 @@ import zlib
 
 from array import array
 
+# NumPy is optional; when it is available, scanlines are unfiltered with it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 __all__ = ['Image', 'Reader', 'Writer', 'write_chunks', 'from_array']
 
@@ -1456,6 +1462,13 @@ class Reader:
         if not previous:
             previous = bytearray([0] * len(scanline))
 
+        # Sub and up filters don't depend on reconstructed bytes
+        # from other pixels of the same scanline, so they can be
+        # undone for the whole scanline at once.
+        if numpy is not None and filter_type in (1, 2):
+            return numpy_undo_filter_scanline(
+                filter_type, fu, scanline, previous)
+
         # Call appropriate filter algorithm.  Note that 0 has already
         # been dealt with.
         fn = (None,
@@ -1564,6 +1577,14 @@ class Reader:
 
         # length of row, in bytes
         rb = self.row_bytes
+
+        if numpy is not None:
+            for recon in numpy_undo_filter_image(
+                    bytearray(itertools.chain(*byte_blocks)),
+                    rb, max(1, self.psize)):
+                yield recon
+            return
+
         a = bytearray()
         # The previous (reconstructed) scanline.
         # None indicates first line of image.
@@ -2283,6 +2304,134 @@ def undo_filter_paeth(filter_unit, scanline, previous, result):
         ai += 1
 
 
+def numpy_undo_filter_scanline(filter_type, filter_unit, scanline, previous):
+    """Undo sub or up filter for a whole scanline with NumPy."""
+
+    x = numpy.frombuffer(bytes(scanline), dtype=numpy.uint8)
+    if filter_type == 2:
+        b = numpy.frombuffer(bytes(previous), dtype=numpy.uint8)
+        return bytearray((x + b).tobytes())
+
+    # The sub filter is a running sum (modulo 256)
+    # of the bytes with the same position in each pixel.
+    size = len(x)
+    padded = numpy.zeros(-(-size // filter_unit) * filter_unit,
+                         dtype=numpy.uint8)
+    padded[:size] = x
+    padded = padded.reshape(-1, filter_unit).cumsum(axis=0,
+                                                    dtype=numpy.uint8)
+    return bytearray(padded.tobytes()[:size])
+
+
+# Maximum number of elements of each skewed buffer
+# used by numpy_undo_filter_image.
+numpy_diagonals_max_size = 2 ** 24
+
+
+def numpy_undo_filter_image(raw, row_bytes, filter_unit):
+    """
+    Undo the filters of a straightlaced image with NumPy;
+    yields each row as a sequence of packed bytes.
+
+    Every filter can be expressed in terms of the reconstructed
+    bytes to the left (a), above (b) and above-left (c),
+    so all pixels in the same anti-diagonal are independent
+    and are reconstructed at once, whatever the filter type of
+    each row is.
+    Images with more rows than pixels per row are unfiltered
+    row by row instead.
+    """
+
+    if len(raw) % (row_bytes + 1) != 0:
+        # :file:format We get here with a file format error:
+        # when the available bytes (after decompressing) do not
+        # pack into exact rows.
+        raise FormatError('Wrong size for decompressed IDAT chunk.')
+
+    height = len(raw) // (row_bytes + 1)
+    if height == 0:
+        return
+
+    data = numpy.frombuffer(bytes(raw), dtype=numpy.uint8)
+    data = data.reshape(height, row_bytes + 1)
+    filter_types = data[:, 0]
+    if filter_types.max() > 4:
+        raise FormatError(
+            'Invalid PNG Filter Type.  '
+            'See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
+
+    # Anti-diagonals only pay off with average or Paeth filters
+    # (otherwise each row only depends on the previous one)
+    # and when rows are not shorter than the image height,
+    # since the skewed buffers grow with height * (height + pixels).
+    pixels = -(-row_bytes // filter_unit)
+    diagonals = height + pixels - 1
+    if (filter_types.max() <= 2 or pixels < height or
+            diagonals * height * filter_unit > numpy_diagonals_max_size):
+        previous = bytearray(row_bytes)
+        for filter_type, scanline in zip(filter_types, data[:, 1:]):
+            if filter_type == 0:
+                previous = bytearray(scanline.tobytes())
+            elif filter_type <= 2:
+                previous = numpy_undo_filter_scanline(
+                    filter_type, filter_unit, scanline, previous)
+            else:
+                result = bytearray(scanline.tobytes())
+                fn = (undo_filter_average,
+                      undo_filter_paeth)[filter_type - 3]
+                fn(filter_unit, result, previous, result)
+                previous = result
+            yield previous
+        return
+
+    scanlines = numpy.zeros((height, pixels * filter_unit),
+                            dtype=numpy.int16)
+    scanlines[:, :row_bytes] = data[:, 1:]
+    scanlines = scanlines.reshape(height, pixels, filter_unit)
+
+    # Reconstructed bytes are stored skewed, indexed by
+    # anti-diagonal and row, so each anti-diagonal is contiguous.
+    # There's an extra row at the top and an extra anti-diagonal
+    # at the beginning, both filled with zeros.
+    skewed_scanlines = numpy.zeros((diagonals, height, filter_unit),
+                                   dtype=numpy.int16)
+    result = numpy.zeros((diagonals + 1, height + 1, filter_unit),
+                         dtype=numpy.int16)
+    for y in range(height):
+        skewed_scanlines[y:y + pixels, y] = scanlines[y]
+
+    column = filter_types.reshape(height, 1)
+    sub_rows = column == 1
+    up_rows = column == 2
+    average_rows = column == 3
+    paeth_rows = column == 4
+    paeth_rows_count = numpy.concatenate(([0], numpy.cumsum(paeth_rows)))
+
+    for diagonal in range(diagonals):
+        first_y = max(0, diagonal - pixels + 1)
+        last_y = min(height, diagonal + 1)
+        rows = slice(first_y, last_y)
+        a = result[diagonal, first_y + 1:last_y + 1]
+        b = result[diagonal, first_y:last_y]
+        predictor = numpy.where(sub_rows[rows], a, 0)
+        predictor += numpy.where(up_rows[rows], b, 0)
+        predictor += numpy.where(average_rows[rows], (a + b) >> 1, 0)
+        if paeth_rows_count[last_y] != paeth_rows_count[first_y]:
+            c = result[diagonal - 1, first_y:last_y] if diagonal else 0
+            pa = numpy.abs(b - c)
+            pb = numpy.abs(a - c)
+            pc = numpy.abs(a + b - c - c)
+            paeth = numpy.where((pa <= pb) & (pa <= pc), a,
+                                numpy.where(pb <= pc, b, c))
+            predictor += numpy.where(paeth_rows[rows], paeth, 0)
+        predictor += skewed_scanlines[diagonal, rows]
+        result[diagonal + 1, first_y + 1:last_y + 1] = predictor & 0xff
+
+    for y in range(height):
+        row = result[y + 1:y + 1 + pixels, y + 1].astype(numpy.uint8)
+        yield bytearray(row.tobytes()[:row_bytes])
+
+
 def convert_la_to_rgba(row, result):
     for i in range(3):
         result[i::4] = row[0::2]
@@ -1,34 +1,121 @@
+import sys
+from array import array
+
 import png
-from itertools import zip_longest
 
 from img_processor import ImageProcessor
 
 class PngProcessor(ImageProcessor):
-    def __init__(self, file_path):
-        super().__init__(file_path)
+    def __init__(self, file_path, decoded_images_cache=None):
+        super().__init__(file_path, decoded_images_cache)
+        self.__file_path = file_path
         with open(file_path, 'rb') as file:
+            r = png.Reader(file)
+            r.preamble()  # IHDR and PLTE chunks only, pixels are decoded on demand.
+            self.width = r.width
+            self.height = r.height
+            try:
+                self.__palette_colors_count = len(r.palette())
+            except png.FormatError: # no palette built in, it must be calculated from the pixels
+                self.__palette_colors_count = None
+
+    def calculate_colors_count(self):
+        colors_count = self.__palette_colors_count
+        if colors_count is None:
+            pixels, colors = self.decode()
+            colors_count = len(colors)
+        # Palettes are made of blocks of 16 colors, the extra ones are padded with black:
+        extra_colors = colors_count % 16
+        if extra_colors > 0 or colors_count == 0:
+            colors_count += 16 - extra_colors
+        return colors_count
+
+    def decode_pixels(self):
+        with open(self.__file_path, 'rb') as file:
             r = png.Reader(file)
             width, height, rows, info = r.read()
-            self.width = width
-            self.height = height
-            self.__pixels = rows
+
+            if info["bitdepth"] > 8:
+                raise ValueError('Invalid bit depth: ' + str(info["bitdepth"]))
+
             try:
-                self.__colors = r.palette()
-            except png.FormatError as e: # no palette built in, calculate
-                channels = 3
-                if info["greyscale"]:
-                    channels = 1
-                if info["alpha"]:
-                    channels += 1
-                self.calculate_palette(rows, channels)
-            self.colors_count = len(self.__colors)
-            if len(self.__colors) < 16:
-                self.colors_count = 16
-
-    def calculate_palette(self, rows, channels):
-        colors = set()
+                colors = [color[:3] for color in r.palette()]
+                pixels = bytearray()
+
+                for row in rows:
+                    pixels.extend(row)
+            except png.FormatError: # no palette built in, index colors reduced to GBA precision
+                pixels, colors = self.__index_colors(rows, info)
+
+        return bytes(pixels), colors
+
+    def __index_colors(self, rows, info):
+        # Colors are reduced to 15-bit precision before being indexed, so colors which are equal on the GBA share
+        # the same index. Index 0 is the transparent color: the one of fully transparent pixels if there's any,
+        # otherwise the color of the top-left pixel.
+        channels = info["planes"]
+        max_value = (1 << info["bitdepth"]) - 1
+        values = bytearray()
+
         for row in rows:
-            args = [iter(row)] * channels
-            for color in zip_longest(*args):
-                colors.add(color)
-        self.__colors = list(colors)
+            values.extend(row)
+
+        if max_value != 255:
+            values = values.translate(bytes((min(value, max_value) * 255) // max_value for value in range(256)))
+
+        # Pack the reduced channels of each pixel into a 32-bit key, with a transparency flag in the last byte:
+        pixels_count = len(values) // channels
+        keys_data = bytearray(pixels_count * 4)
+
+        for channel in range(3):
+            color_channel = 0 if info["greyscale"] else channel
+            keys_data[channel::4] = values[color_channel::channels].translate(_REDUCE_CHANNEL)
+
+        if info["alpha"]:
+            keys_data[3::4] = values[channels - 1::channels].translate(_TRANSPARENT_ALPHA)
+
+        keys = array('I')
+        keys.frombytes(keys_data)
+        color_indices = {}
+        colors = []
+        transparent_color = None
+
+        for key in dict.fromkeys(keys):
+            key_bytes = key.to_bytes(4, sys.byteorder)
+
+            if key_bytes[3]:
+                color_indices[key] = 0
+
+                if transparent_color is None:
+                    transparent_color = tuple(key_bytes[:3])
+            else:
+                color_indices[key] = len(colors)
+                colors.append(tuple(key_bytes[:3]))
+
+        if transparent_color is not None:
+            used_colors = set(colors)
+
+            if transparent_color in used_colors:
+                # The transparent color must not be used by visible pixels:
+                for transparent_color_value in range(0x8000):
+                    transparent_color = ((transparent_color_value & 31) << 3,
+                                         ((transparent_color_value >> 5) & 31) << 3,
+                                         (transparent_color_value >> 10) << 3)
+
+                    if transparent_color not in used_colors:
+                        break
+
+            colors.insert(0, transparent_color)
+
+            for key, color_index in color_indices.items():
+                if not key.to_bytes(4, sys.byteorder)[3]:
+                    color_indices[key] = color_index + 1
+
+        if len(colors) > 256:
+            raise ValueError('Too many colors in image: ' + self.__file_path + ' (' + str(len(colors)) + ')')
+
+        return bytes(map(color_indices.__getitem__, keys)), colors
+
+
+_REDUCE_CHANNEL = bytes(value & 0xF8 for value in range(256))
+_TRANSPARENT_ALPHA = bytes([1]) + bytes(255)
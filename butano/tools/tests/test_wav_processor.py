@@ -0,0 +1,39 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wav_processor import WavProcessor
+
+
+class WavProcessorTest(unittest.TestCase):
+
+    def test_trim_silence_keeps_one_frame(self):
+        with tempfile.TemporaryDirectory() as temp_folder_path:
+            input_file_path = os.path.join(temp_folder_path, 'silence.wav')
+
+            with wave.open(input_file_path, 'wb') as input_file:
+                input_file.setnchannels(2)
+                input_file.setsampwidth(2)
+                input_file.setframerate(22050)
+                input_file.writeframes(bytes(2 * 2 * 1000))
+
+            output_file = io.BytesIO()
+            WavProcessor(input_file_path, {'trim_silence': True}).process(output_file)
+            output_file.seek(0)
+
+            with wave.open(output_file, 'rb') as wav_file:
+                self.assertGreaterEqual(wav_file.getnframes(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
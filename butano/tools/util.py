@@ -1,16 +1,35 @@
 import os
+import struct
 
 from bmp import BMP
+from build_trace import traced
+from decoded_images_cache import DecodedImagesCache
 from png_processor import PngProcessor
 
-def remove_file(file_path):
-    if os.path.exists(file_path):
-        os.remove(file_path)
+def get_decoded_images_cache(build_folder_path):
+    return DecodedImagesCache(os.path.join(build_folder_path, '_bn_decoded_images'))
+
+
+@traced
+def get_processor(file_path, build_folder_path=None):
+    decoded_images_cache = None
+    if build_folder_path is not None:
+        decoded_images_cache = get_decoded_images_cache(build_folder_path)
+    if file_path.endswith(".png"):
+        return PngProcessor(file_path, decoded_images_cache)
+    return BMP(file_path, decoded_images_cache)
+
+
+def get_image_size(file_path):
+    with open(file_path, 'rb') as file:
+        header = file.read(26)
 
-def get_processor(file_path):
     if file_path.endswith(".png"):
-        return PngProcessor(file_path)
-    return BMP(file_path)
+        width, height = struct.unpack('>II', header[16:24])
+    else:
+        width, height = struct.unpack('<ii', header[18:26])
+
+    return abs(width), abs(height)
 
 
 def validate_compression(compression):
@@ -0,0 +1,187 @@
+"""
+Copyright (c) 2020-2022 Gustavo Valiente gustavo.valiente@protonmail.com
+zlib License, see LICENSE file.
+"""
+
+import itertools
+import sys
+import wave
+from array import array
+
+
+# Samples with less amplitude than this are silent once converted to 8 bits per sample:
+_SILENCE_THRESHOLD = 128
+
+
+class WavProcessor:
+
+    def __init__(self, file_path, info):
+        try:
+            self.__mono = bool(info['mono'])
+        except KeyError:
+            self.__mono = False
+
+        try:
+            self.__sample_rate = int(info['sample_rate'])
+
+            if self.__sample_rate <= 0:
+                raise ValueError('Invalid sample rate: ' + str(self.__sample_rate))
+        except KeyError:
+            self.__sample_rate = None
+
+        try:
+            self.__bits_per_sample = int(info['bits_per_sample'])
+
+            if self.__bits_per_sample != 8 and self.__bits_per_sample != 16:
+                raise ValueError('Invalid bits per sample: ' + str(self.__bits_per_sample))
+        except KeyError:
+            self.__bits_per_sample = None
+
+        try:
+            self.__trim_silence = bool(info['trim_silence'])
+        except KeyError:
+            self.__trim_silence = False
+
+        try:
+            with wave.open(file_path, 'rb') as wav_file:
+                self.__channels_count = wav_file.getnchannels()
+                self.__sample_width = wav_file.getsampwidth()
+                self.__frame_rate = wav_file.getframerate()
+                self.__frames = wav_file.readframes(wav_file.getnframes())
+        except (EOFError, wave.Error) as exc:
+            raise ValueError('Invalid WAV file: ' + str(exc))
+
+        if self.__sample_width > 4:
+            raise ValueError('Invalid WAV sample width: ' + str(self.__sample_width))
+
+    def process(self, output_file):
+        channels = self.__decode_channels()
+
+        if self.__mono and len(channels) > 1:
+            channels = [_downmix(channels)]
+
+        frame_rate = self.__frame_rate
+
+        if self.__sample_rate is not None and self.__sample_rate != frame_rate:
+            channels = [_resample(channel, frame_rate, self.__sample_rate) for channel in channels]
+            frame_rate = self.__sample_rate
+
+        if self.__trim_silence:
+            channels = _trim_silence(channels)
+
+        bits_per_sample = self.__bits_per_sample
+
+        if bits_per_sample is None:
+            bits_per_sample = 8 if self.__sample_width == 1 else 16
+
+        if bits_per_sample == 8:
+            samples = array('B', [min((sample + 128) >> 8, 127) + 128 for sample in _interleave(channels)])
+        else:
+            samples = array('h', _interleave(channels))
+
+            if sys.byteorder != 'little':
+                samples.byteswap()
+
+        with wave.open(output_file, 'wb') as wav_file:
+            wav_file.setnchannels(len(channels))
+            wav_file.setsampwidth(bits_per_sample // 8)
+            wav_file.setframerate(frame_rate)
+            wav_file.writeframes(samples.tobytes())
+
+    def __decode_channels(self):
+        frames = self.__frames
+        sample_width = self.__sample_width
+
+        # Samples are converted to signed 16 bits:
+        if sample_width == 1:
+            samples = [sample - 128 << 8 for sample in frames]
+        elif sample_width == 2:
+            samples = array('h')
+            samples.frombytes(frames[:len(frames) // 2 * 2])
+
+            if sys.byteorder != 'little':
+                samples.byteswap()
+        else:
+            samples = [int.from_bytes(frames[index:index + sample_width], 'little', signed=True) >>
+                       (sample_width * 8 - 16) for index in range(0, len(frames) - sample_width + 1, sample_width)]
+
+        channels_count = self.__channels_count
+        frames_count = len(samples) // channels_count
+        return [list(samples[channel:frames_count * channels_count:channels_count])
+                for channel in range(channels_count)]
+
+
+def _downmix(channels):
+    channels_count = len(channels)
+    return [sum(samples) // channels_count for samples in zip(*channels)]
+
+
+def _resample(channel, input_rate, output_rate):
+    input_count = len(channel)
+
+    if input_count == 0:
+        return channel
+
+    output_count = max((input_count * output_rate + input_rate // 2) // input_rate, 1)
+    last_index = input_count - 1
+    output = []
+
+    if output_rate < input_rate:
+        # Frequencies above the new Nyquist frequency are attenuated with two box filters as wide as the decimation
+        # ratio (a triangular filter), so they don't alias as much. The second one is applied while sampling:
+        ratio = input_rate / output_rate
+        channel = _box_filter(channel, range(input_count), ratio)
+        return _box_filter(channel, [output_index * ratio for output_index in range(output_count)], ratio)
+
+    # Linear interpolation:
+    for output_index in range(output_count):
+        position = output_index * input_rate / output_rate
+        index = int(position)
+
+        if index >= last_index:
+            output.append(channel[last_index])
+        else:
+            sample = channel[index]
+            output.append(sample + int((channel[index + 1] - sample) * (position - index)))
+
+    return output
+
+
+def _box_filter(channel, positions, width):
+    # Returns the average of the samples around each position:
+    sums = list(itertools.accumulate(channel, initial=0))
+    last_index = len(channel) - 1
+    output = []
+
+    for position in positions:
+        first_index = min(max(int(position - width / 2 + 0.5), 0), last_index)
+        end_index = min(max(int(position + width / 2 + 0.5), first_index + 1), last_index + 1)
+        output.append((sums[end_index] - sums[first_index]) // (end_index - first_index))
+
+    return output
+
+
+def _trim_silence(channels):
+    frames_count = len(channels[0])
+    first_frame = 0
+    last_frame = frames_count
+
+    while first_frame < last_frame and all(abs(channel[first_frame]) < _SILENCE_THRESHOLD for channel in channels):
+        first_frame += 1
+
+    while last_frame > first_frame and all(abs(channel[last_frame - 1]) < _SILENCE_THRESHOLD for channel in channels):
+        last_frame -= 1
+
+    # mmutil doesn't like empty samples, so at least one frame is kept:
+    if first_frame == last_frame:
+        first_frame = max(frames_count - 1, 0)
+        last_frame = frames_count
+
+    return [channel[first_frame:last_frame] for channel in channels]
+
+
+def _interleave(channels):
+    if len(channels) == 1:
+        return channels[0]
+
+    return [sample for samples in zip(*channels) for sample in samples]